@@ -1,122 +1,171 @@
 #!/usr/bin/env python3
 """
-Script to clean up duplicate documents in Solr based on content hash and file path
+Script to clean up duplicate documents in Solr based on file path
+
+Install ijson (pip install ijson) to parse result pages as they stream in;
+without it each page is parsed in memory with requests.
 """
 
 import os
 import requests
-import time
-from collections import defaultdict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from xml.sax.saxutils import escape
+from itertools import islice
 import argparse
 
-def get_all_documents(solr_url, batch_size=1000):
-    """Retrieve all documents from Solr"""
-    documents = []
-    start = 0
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Number of ids sent per <delete> request
+DELETE_BATCH_SIZE = 1000
+
+# Shared connection pool for all Solr requests
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32,
+                      max_retries=Retry(total=3, backoff_factor=0.1))
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+# Documents grouped by file_path, newest first; the id tiebreak keeps cursorMark paging stable
+NEWEST_FIRST_BY_PATH = 'file_path asc, modified_date desc, id asc'
+
+def _stream_docs(response):
+    """Yield documents from a streamed Solr response, then return nextCursorMark"""
+    next_cursor = None
+    builder = None
+    
+    for prefix, event, value in ijson.parse(response.raw):
+        if prefix == 'response.docs.item' and event == 'start_map':
+            builder = ijson.ObjectBuilder()
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == 'response.docs.item' and event == 'end_map':
+                yield builder.value
+                builder = None
+        elif prefix == 'nextCursorMark':
+            next_cursor = value
+    
+    return next_cursor
+
+def get_all_docs(solr_url, fields='id', sort='id asc', batch_size=1000):
+    """Stream the requested fields of all documents using cursorMark deep paging"""
+    cursor = '*'
+    params = {
+        'q': '*:*',
+        'rows': batch_size,
+        'fl': fields,
+        'sort': sort,
+        'wt': 'json'
+    }
     
     while True:
-        response = requests.get(f"{solr_url}/select", params={
-            'q': '*:*',
-            'start': start,
-            'rows': batch_size,
-            'fl': 'id,file_path,content_hash,modified_date',
-            'wt': 'json'
-        })
+        response = session.get(f"{solr_url}/select", params={**params, 'cursorMark': cursor}, stream=True)
         
         if response.status_code != 200:
             print(f"Error querying Solr: {response.status_code}")
             break
-            
-        data = response.json()
-        docs = data['response']['docs']
         
-        if not docs:
-            break
-            
-        documents.extend(docs)
-        start += batch_size
-        print(f"Retrieved {len(documents)} documents...")
+        if ijson is not None:
+            # Parse documents as they arrive instead of loading the whole page
+            response.raw.decode_content = True
+            next_cursor = yield from _stream_docs(response)
+        else:
+            data = response.json()
+            yield from data['response']['docs']
+            next_cursor = data.get('nextCursorMark')
+        response.close()
         
-        if len(docs) < batch_size:
+        # Solr returns the same cursor once the result set is exhausted
+        if next_cursor is None or next_cursor == cursor:
             break
-    
-    return documents
+        cursor = next_cursor
 
-def find_duplicates(documents):
-    """Find duplicate documents based on file_path and content_hash"""
-    
-    # Group by file_path
-    path_groups = defaultdict(list)
-    for doc in documents:
-        file_path = doc.get('file_path', '')
-        if file_path:
-            path_groups[file_path].append(doc)
-    
-    # Find actual duplicates
-    duplicates_to_remove = []
-    
-    for file_path, docs in path_groups.items():
-        if len(docs) > 1:
-            print(f"Found {len(docs)} duplicates for: {file_path}")
-            
-            # Sort by modified_date (newest first)
-            docs.sort(key=lambda x: x.get('modified_date', ''), reverse=True)
-            
-            # Keep the newest one, mark others for deletion
-            keeper = docs[0]
-            to_remove = docs[1:]
-            
-            print(f"  Keeping: {keeper['id']} (modified: {keeper.get('modified_date', 'unknown')})")
-            for doc in to_remove:
-                print(f"  Removing: {doc['id']} (modified: {doc.get('modified_date', 'unknown')})")
-                duplicates_to_remove.append(doc['id'])
-    
-    return duplicates_to_remove
+def find_duplicates(solr_url):
+    """Stream the id of every document that is not the newest one for its file_path"""
+    
+    # The first document of each file_path group is the one to keep and everything
+    # after it is a duplicate, so only the current path is held in memory
+    total = 0
+    paths = 0
+    current_path = None
+    for doc in get_all_docs(solr_url, fields='id,file_path', sort=NEWEST_FIRST_BY_PATH):
+        total += 1
+        if total % 1000 == 0:
+            print(f"Checked {total} documents...")
+        
+        file_path = doc.get('file_path')
+        if file_path is not None and file_path == current_path:
+            yield doc['id']
+        else:
+            current_path = file_path
+            paths += 1
+    
+    print(f"Checked {total} documents across {paths} unique file paths")
 
 def delete_documents(solr_url, doc_ids, dry_run=True):
-    """Delete documents from Solr"""
-    
-    if not doc_ids:
-        print("No duplicates found to delete")
-        return
-    
-    print(f"\nFound {len(doc_ids)} duplicate documents to delete")
+    """Delete documents from Solr, streaming ids from any iterable in batches"""
+    doc_ids = iter(doc_ids)
     
     if dry_run:
+        preview = list(islice(doc_ids, 10))  # Show first 10
+        total = len(preview) + sum(1 for _ in doc_ids)
+        if not total:
+            print("No duplicates found to delete")
+            return 0
+        
+        print(f"\nFound {total} duplicate documents to delete")
         print("DRY RUN - Would delete the following documents:")
-        for doc_id in doc_ids[:10]:  # Show first 10
+        for doc_id in preview:
             print(f"  - {doc_id}")
-        if len(doc_ids) > 10:
-            print(f"  ... and {len(doc_ids) - 10} more")
+        if total > 10:
+            print(f"  ... and {total - 10} more")
         print("\nRun with --execute to actually delete duplicates")
-        return
+        return total
     
-    # Delete documents one by one using query-based deletion
+    # Delete documents in batches, committing once at the end
+    total = 0
     success_count = 0
-    for doc_id in doc_ids:
+    while chunk := list(islice(doc_ids, DELETE_BATCH_SIZE)):
+        total += len(chunk)
         try:
-            # Use query-based deletion which is more reliable
-            delete_query = f'id:"{doc_id}"'
+            payload = '<delete>' + ''.join(f'<id>{escape(doc_id)}</id>' for doc_id in chunk) + '</delete>'
             
-            response = requests.post(
-                f"{solr_url}/update?commit=true",
-                data=f'<delete><query>{delete_query}</query></delete>',
+            response = session.post(
+                f"{solr_url}/update",
+                data=payload.encode('utf-8'),
                 headers={'Content-Type': 'text/xml'}
             )
             
             if response.status_code == 200:
-                success_count += 1
-                if success_count % 10 == 0:
-                    print(f"Deleted {success_count}/{len(doc_ids)} documents...")
+                success_count += len(chunk)
+                print(f"Deleted {success_count} documents...")
             else:
-                print(f"Error deleting {doc_id}: {response.status_code}")
+                print(f"Error deleting batch of {len(chunk)} documents: {response.status_code}")
                 
         except Exception as e:
-            print(f"Error deleting {doc_id}: {e}")
-        
-        time.sleep(0.05)  # Small delay between deletions
+            print(f"Error deleting batch of {len(chunk)} documents: {e}")
+    
+    if not total:
+        print("No duplicates found to delete")
+        return 0
+    
+    # Single commit for all batches
+    try:
+        response = session.post(
+            f"{solr_url}/update?commit=true",
+            data='<commit/>',
+            headers={'Content-Type': 'text/xml'}
+        )
+        if response.status_code != 200:
+            print(f"Error committing deletions: {response.status_code}")
+    except Exception as e:
+        print(f"Error committing deletions: {e}")
     
-    print(f"Successfully deleted {success_count}/{len(doc_ids)} documents")
+    print(f"Successfully deleted {success_count}/{total} documents")
+    return success_count
 
 def main():
     parser = argparse.ArgumentParser(description='Clean up duplicate documents in Solr')
@@ -129,22 +178,17 @@ def main():
     
     print(f"Connecting to Solr at: {args.solr_url}")
     
-    # Get all documents
-    print("Retrieving all documents from Solr...")
-    documents = get_all_documents(args.solr_url)
-    print(f"Found {len(documents)} total documents")
-    
     # Find duplicates
-    print("\nAnalyzing for duplicates...")
-    duplicates = find_duplicates(documents)
+    print("Retrieving and analyzing all documents from Solr...")
+    duplicates = find_duplicates(args.solr_url)
     
     # Delete duplicates
-    delete_documents(args.solr_url, duplicates, dry_run=not args.execute)
+    count = delete_documents(args.solr_url, duplicates, dry_run=not args.execute)
     
     if args.execute:
-        print(f"\nCleanup complete! Deleted {len(duplicates)} duplicate documents")
+        print(f"\nCleanup complete! Deleted {count} duplicate documents")
     else:
-        print(f"\nDry run complete. Found {len(duplicates)} duplicates to clean up")
+        print(f"\nDry run complete. Found {count} duplicates to clean up")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
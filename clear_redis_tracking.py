@@ -7,6 +7,19 @@ import redis
 import os
 import argparse
 
+def _unlink_matching(r, pattern, batch_size=5000):
+    """Incrementally SCAN keys matching pattern and UNLINK them in pipelined batches"""
+    pipe = r.pipeline(transaction=False)
+    count = 0
+    for key in r.scan_iter(match=pattern, count=10000):
+        pipe.unlink(key)
+        count += 1
+        if count % batch_size == 0:
+            pipe.execute()
+            pipe = r.pipeline(transaction=False)
+    pipe.execute()
+    return count
+
 def clear_redis_tracking(redis_url):
     """Clear all tracking data from Redis"""
     try:
@@ -20,44 +33,23 @@ def clear_redis_tracking(redis_url):
         # Clear processed files set
         processed_count = r.scard('processed_files')
         if processed_count > 0:
-            r.delete('processed_files')
+            r.unlink('processed_files')
             print(f"Cleared processed_files set ({processed_count} entries)")
             keys_cleared += 1
         
         # Clear queued files set
         queued_count = r.scard('queued_files')
         if queued_count > 0:
-            r.delete('queued_files')
+            r.unlink('queued_files')
             print(f"Cleared queued_files set ({queued_count} entries)")
             keys_cleared += 1
         
-        # Clear processed:* keys
-        processed_keys = r.keys('processed:*')
-        if processed_keys:
-            r.delete(*processed_keys)
-            print(f"Cleared {len(processed_keys)} processed:* keys")
-            keys_cleared += len(processed_keys)
-        
-        # Clear file_hash:* keys
-        hash_keys = r.keys('file_hash:*')
-        if hash_keys:
-            r.delete(*hash_keys)
-            print(f"Cleared {len(hash_keys)} file_hash:* keys")
-            keys_cleared += len(hash_keys)
-        
-        # Clear global_processing:* keys
-        processing_keys = r.keys('global_processing:*')
-        if processing_keys:
-            r.delete(*processing_keys)
-            print(f"Cleared {len(processing_keys)} global_processing:* keys")
-            keys_cleared += len(processing_keys)
-        
-        # Clear queue_lock:* keys
-        lock_keys = r.keys('queue_lock:*')
-        if lock_keys:
-            r.delete(*lock_keys)
-            print(f"Cleared {len(lock_keys)} queue_lock:* keys")
-            keys_cleared += len(lock_keys)
+        # Clear per-file tracking keys without blocking the server on KEYS
+        for pattern in ('processed:*', 'file_hash:*', 'fprint:*', 'global_processing:*', 'queue_lock:*', 'solr_meta:*'):
+            count = _unlink_matching(r, pattern)
+            if count:
+                print(f"Cleared {count} {pattern} keys")
+                keys_cleared += count
         
         print(f"\nTotal keys cleared: {keys_cleared}")
         
@@ -4,76 +4,59 @@ Fast duplicate cleanup - removes all duplicates in bulk operations
 """
 
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
 from collections import defaultdict
 import argparse
 
-def get_all_file_paths(solr_url):
-    """Get all unique file paths from Solr"""
-    file_paths = set()
-    start = 0
-    batch_size = 1000
-    
-    while True:
-        response = requests.get(f"{solr_url}/select", params={
-            'q': '*:*',
-            'start': start,
-            'rows': batch_size,
-            'fl': 'file_path',
-            'wt': 'json'
-        })
-        
-        if response.status_code != 200:
-            print(f"Error querying Solr: {response.status_code}")
-            break
-            
-        data = response.json()
-        docs = data['response']['docs']
-        
-        if not docs:
-            break
-            
-        for doc in docs:
-            file_path = doc.get('file_path')
-            if file_path:
-                file_paths.add(file_path)
-        
-        start += batch_size
-        print(f"Retrieved {len(file_paths)} unique file paths...")
-        
-        if len(docs) < batch_size:
-            break
-    
-    return file_paths
+# Shared connection pool for all Solr requests
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32,
+                      max_retries=Retry(total=3, backoff_factor=0.1))
+session.mount('http://', adapter)
+session.mount('https://', adapter)
 
-def count_duplicates_per_path(solr_url, file_paths):
-    """Count how many documents exist for each file path"""
+def find_duplicate_paths(solr_url):
+    """Find file paths indexed more than once using a single faceted query"""
     duplicates = {}
     
-    for file_path in file_paths:
-        response = requests.get(f"{solr_url}/select", params={
-            'q': f'file_path:"{file_path}"',
-            'rows': 0,
-            'wt': 'json'
-        })
-        
-        if response.status_code == 200:
-            data = response.json()
-            count = data['response']['numFound']
-            if count > 1:
-                duplicates[file_path] = count
-                print(f"Found {count} duplicates for: {file_path}")
+    response = session.get(f"{solr_url}/select", params={
+        'q': '*:*',
+        'rows': 0,
+        'facet': 'true',
+        'facet.field': 'file_path',
+        'facet.mincount': 2,
+        'facet.limit': -1,
+        'wt': 'json'
+    })
+    
+    if response.status_code != 200:
+        print(f"Error querying Solr: {response.status_code}")
+        return duplicates
+    
+    data = response.json()
+    # Facet counts come back as a flat [path, count, path, count, ...] list
+    facet_values = data['facet_counts']['facet_fields']['file_path']
+    for file_path, count in zip(facet_values[::2], facet_values[1::2]):
+        duplicates[file_path] = count
+        print(f"Found {count} duplicates for: {file_path}")
     
     return duplicates
 
+def _quote(value):
+    """Quote a value as a Solr phrase, escaping backslashes and quotes"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
 def cleanup_duplicates_for_path(solr_url, file_path, count):
-    """Remove all documents for a file path, then re-add one"""
+    """Remove every document for a file path except the newest one"""
     try:
-        # First, get one document to keep
-        response = requests.get(f"{solr_url}/select", params={
-            'q': f'file_path:"{file_path}"',
+        # First, find the document to keep
+        response = session.get(f"{solr_url}/select", params={
+            'q': f'file_path:{_quote(file_path)}',
             'rows': 1,
-            'fl': '*',
+            'fl': 'id',
             'sort': 'modified_date desc',
             'wt': 'json'
         })
@@ -87,12 +70,13 @@ def cleanup_duplicates_for_path(solr_url, file_path, count):
             print(f"No documents found for {file_path}")
             return True
         
-        keeper_doc = data['response']['docs'][0]
+        keeper_id = data['response']['docs'][0]['id']
         
-        # Delete all documents with this file_path
-        delete_response = requests.post(
-            f"{solr_url}/update?commit=true",
-            data=f'<delete><query>file_path:"{file_path}"</query></delete>',
+        # Delete all other documents with this file_path in one request
+        delete_query = f'file_path:{_quote(file_path)} AND -id:{_quote(keeper_id)}'
+        delete_response = session.post(
+            f"{solr_url}/update",
+            data=f'<delete><query>{escape(delete_query)}</query></delete>'.encode('utf-8'),
             headers={'Content-Type': 'text/xml'}
         )
         
@@ -100,17 +84,6 @@ def cleanup_duplicates_for_path(solr_url, file_path, count):
             print(f"Error deleting documents for {file_path}: {delete_response.status_code}")
             return False
         
-        # Re-add the keeper document
-        add_response = requests.post(
-            f"{solr_url}/update?commit=true",
-            json=[keeper_doc],
-            headers={'Content-Type': 'application/json'}
-        )
-        
-        if add_response.status_code != 200:
-            print(f"Error re-adding document for {file_path}: {add_response.status_code}")
-            return False
-        
         print(f"Cleaned up {count-1} duplicates for: {file_path}")
         return True
         
@@ -118,25 +91,38 @@ def cleanup_duplicates_for_path(solr_url, file_path, count):
         print(f"Error cleaning up {file_path}: {e}")
         return False
 
+def commit(solr_url):
+    """Issue a single hard commit so all pending updates become visible"""
+    try:
+        response = session.post(
+            f"{solr_url}/update?commit=true",
+            data='<commit/>',
+            headers={'Content-Type': 'text/xml'}
+        )
+        if response.status_code != 200:
+            print(f"Error committing changes: {response.status_code}")
+            return False
+        return True
+    except Exception as e:
+        print(f"Error committing changes: {e}")
+        return False
+
 def main():
     parser = argparse.ArgumentParser(description='Fast cleanup of duplicate documents in Solr')
     parser.add_argument('--solr-url', default='http://solr:8983/solr/nas_content',
                        help='Solr URL (default: http://solr:8983/solr/nas_content)')
     parser.add_argument('--execute', action='store_true',
                        help='Actually delete duplicates (default is dry run)')
+    parser.add_argument('--workers', type=int, default=16,
+                       help='Number of paths cleaned up concurrently (default: 16)')
     
     args = parser.parse_args()
     
     print(f"Connecting to Solr at: {args.solr_url}")
     
-    # Get all unique file paths
-    print("Getting all unique file paths...")
-    file_paths = get_all_file_paths(args.solr_url)
-    print(f"Found {len(file_paths)} unique file paths")
-    
-    # Count duplicates
+    # Find paths with more than one document
     print("Checking for duplicates...")
-    duplicates = count_duplicates_per_path(args.solr_url, file_paths)
+    duplicates = find_duplicate_paths(args.solr_url)
     
     total_duplicates = sum(count - 1 for count in duplicates.values())
     print(f"\nFound {len(duplicates)} file paths with duplicates")
@@ -146,13 +132,15 @@ def main():
         print("\nDry run complete. Use --execute to actually clean up duplicates")
         return
     
-    # Clean up duplicates
+    # Clean up duplicates, one path per worker
     print("\nCleaning up duplicates...")
-    success_count = 0
-    for file_path, count in duplicates.items():
-        if cleanup_duplicates_for_path(args.solr_url, file_path, count):
-            success_count += 1
-        time.sleep(0.1)  # Small delay between operations
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = pool.map(lambda item: cleanup_duplicates_for_path(args.solr_url, *item),
+                           duplicates.items())
+        success_count = sum(1 for ok in results if ok)
+    
+    # Updates above are sent without commit; make them visible in one go
+    commit(args.solr_url)
     
     print(f"\nCleanup complete! Successfully cleaned {success_count}/{len(duplicates)} file paths")
 
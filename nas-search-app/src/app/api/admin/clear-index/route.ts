@@ -27,6 +27,8 @@ export async function POST() {
       console.log('- processed:* (keys)');
       console.log('- file_hash:* (keys)');
       console.log('- global_processing:* (keys)');
+      console.log('- fprint:* (keys)');
+      console.log('- solr_meta:* (keys)');
     } catch (redisError) {
       console.warn('Could not clear Redis data:', redisError);
       // Continue even if Redis clearing fails
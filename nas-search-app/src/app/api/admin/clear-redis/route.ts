@@ -66,6 +66,22 @@ export async function POST() {
       keysCleared += lockKeys.length;
     }
     
+    // Clear fprint:* keys (size/mtime of indexed files, used to skip unchanged files)
+    const fprintKeys = await client.keys('fprint:*');
+    if (fprintKeys.length > 0) {
+      await client.del(fprintKeys);
+      clearedData.push(`Cleared ${fprintKeys.length} fprint:* keys`);
+      keysCleared += fprintKeys.length;
+    }
+    
+    // Clear solr_meta:* keys (cached state of indexed documents)
+    const solrMetaKeys = await client.keys('solr_meta:*');
+    if (solrMetaKeys.length > 0) {
+      await client.del(solrMetaKeys);
+      clearedData.push(`Cleared ${solrMetaKeys.length} solr_meta:* keys`);
+      keysCleared += solrMetaKeys.length;
+    }
+    
     await client.disconnect();
     
     const message = keysCleared === 0 
@@ -5,17 +5,24 @@ File Monitor Service - Watches NAS filesystem for changes and queues files for p
 
 import os
 import time
-import json
+import logging
 import hashlib
+import mmap
+import queue
+import re
+import signal
+import ssl
+import sys
 from pathlib import Path
-from typing import Set, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import threading
-from datetime import datetime
 
+import orjson
 import redis
 import structlog
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler, FileSystemEvent
+from redis.utils import HIREDIS_AVAILABLE
+from inotify_simple import INotify, flags
 
 # Configure structured logging
 structlog.configure(
@@ -38,11 +45,55 @@ structlog.configure(
 
 logger = structlog.get_logger()
 
-class NASFileHandler(FileSystemEventHandler):
+# Bytes of a memory-mapped file passed to a single hash update
+HASH_SLICE_SIZE = 16 * 1024 * 1024
+
+# Atomically decide whether a file should be queued and, only if so, take its
+# global processing lock. Runs server-side so there is no window between the
+# checks and the lock, and files that are skipped never hold a lock. The
+# fingerprint is the one the metadata extractor recorded when it last indexed the file.
+# KEYS: global_processing:<path>, queued_files, processed:<path>, fprint:<path>
+# ARGV: path, fingerprint ("" for none), current unix time, "1" to check processed time
+CLAIM_FILE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 'locked' end
+if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then return 'queued' end
+if ARGV[4] == '1' then
+    local last_processed = tonumber(redis.call('GET', KEYS[3]))
+    if last_processed and tonumber(ARGV[3]) - last_processed < 7200 then return 'recent' end
+end
+if ARGV[2] ~= '' and redis.call('GET', KEYS[4]) == ARGV[2] then return 'unchanged' end
+redis.call('SET', KEYS[1], 'processing', 'EX', 1800)
+return 'claimed'
+"""
+
+# Larger live files are queued without a content hash; the extractor hashes
+# them while it already has the file open
+INLINE_HASH_MAX_SIZE = 64 * 1024 * 1024
+
+# Skip access-time updates when hashing (a metadata write per file on a NAS);
+# only permitted for files we own, so opening falls back to a plain read
+O_NOATIME = getattr(os, 'O_NOATIME', 0)
+
+# Seconds to wait for the MOVED_TO half of a directory move before treating the
+# directory as moved out of the watched tree (deleted)
+MOVE_PAIR_TIMEOUT = 1.0
+
+# Characters with a meaning in Redis MATCH patterns, escaped to match literally
+GLOB_SPECIAL_CHARS = re.compile(r'([\\*?\[\]])')
+
+# Date format expected by Solr date fields
+ISO_UTC_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Hashing is dominated by NAS read latency, so more workers than cores pays off;
+# without a GIL the digest work itself also runs in parallel
+GIL_ENABLED = getattr(sys, '_is_gil_enabled', lambda: True)()
+DEFAULT_HASH_WORKERS = 8 if GIL_ENABLED else 32
+
+class NASFileHandler:
     """Handles filesystem events for NAS files"""
     
     # Supported file extensions
-    SUPPORTED_EXTENSIONS = {
+    SUPPORTED_EXTENSIONS = frozenset({
         # Images
         '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.raw', '.cr2', '.nef', '.arw',
         # Videos
@@ -53,23 +104,45 @@ class NASFileHandler(FileSystemEventHandler):
         '.pdf', '.doc', '.docx', '.txt', '.rtf', '.odt', '.pages',
         # Archives
         '.zip', '.rar', '.7z', '.tar', '.gz'
-    }
+    })
     
-    def __init__(self, redis_client: redis.Redis, mount_paths: str):
+    def __init__(self, redis_client: redis.Redis, mount_paths: str, hash_workers: int = DEFAULT_HASH_WORKERS):
         self.redis_client = redis_client
         self.processing_queue = 'file_processing_queue'
-        self.processed_files: Set[str] = set()
+        self._claim_file = redis_client.register_script(CLAIM_FILE_SCRIPT)
         
         # Parse multiple mount paths
         self.mount_points = self._parse_mount_paths(mount_paths)
+        # (prefix with trailing slash, volume name) in configured order, matched by _get_standardized_path
+        self._mount_prefixes = [(str(mount_point).rstrip('/') + '/', volume_name) 
+                                for volume_name, mount_point in self.mount_points.items()]
+        
+        self._queued_at_cache = (0, '')  # (unix second, formatted queued_at)
         
-        # Event debouncing: track recent events to prevent duplicates
+        # Bounded queue between the inotify reader and the drain thread (backpressure);
+        # each item is the list of events from one inotify read
+        self.event_queue: queue.Queue = queue.Queue(maxsize=1000)
+        self.batch_size = 256  # events pulled from the queue per drain iteration
+        self.enqueue_timeout = 30.0  # seconds the inotify reader waits for room before dropping events
+        self.dropped_events = 0
+        
+        # Event debouncing: track recent events to prevent duplicates (owned by drain thread)
         self.pending_events: Dict[str, Dict] = {}  # file_path -> event_data
-        self.debounce_delay = 5.0  # seconds to wait before processing events
-        self.debounce_lock = threading.Lock()
+        self.debounce_delay = 5.0  # seconds of quiet before processing events
+        
+        # Queue writes buffered across batches and flushed as a single pipeline
+        self._pipe_buf: List[Tuple[str, str, str, str, Dict[str, Any]]] = []
+        self._pipe_last_flush = time.monotonic()
+        self._pipe_lock = threading.Lock()
+        self.flush_size = 1000  # buffered files that force a flush
+        self.flush_interval = 0.5  # seconds before a partial buffer is flushed
         
-        # Load processed files from Redis on startup
-        self._load_processed_files()
+        # hashlib releases the GIL while reading and hashing, so files in a batch
+        # hash in parallel and one slow NAS read does not stall the others
+        self._hash_pool = ThreadPoolExecutor(max_workers=hash_workers, thread_name_prefix='hash')
+        
+        self._drain_thread = threading.Thread(target=self._drain_events, daemon=True)
+        self._drain_thread.start()
         
     def _parse_mount_paths(self, mount_paths: str) -> Dict[str, Path]:
         """Parse MOUNT_PATHS environment variable into volume name -> path mapping"""
@@ -86,271 +159,546 @@ class NASFileHandler(FileSystemEventHandler):
         
         return mount_points
     
-    def _get_standardized_path(self, file_path: Path) -> str:
-        """Convert container file path to standardized index path"""
-        # Find which mount point this file belongs to
-        for volume_name, mount_point in self.mount_points.items():
-            try:
-                # Check if file_path is under this mount point
-                relative_path = file_path.relative_to(mount_point)
+    def _get_standardized_path(self, file_path) -> str:
+        """Convert container file path (Path or str) to standardized index path"""
+        path_str = os.fspath(file_path)
+        # Find which mount point this file belongs to with plain prefix checks
+        for prefix, volume_name in self._mount_prefixes:
+            if path_str.startswith(prefix):
                 # Return standardized path: /volume_name/relative_path
-                return f"/{volume_name}/{relative_path}"
-            except ValueError:
-                # file_path is not under this mount_point
-                continue
+                return f"/{volume_name}/{path_str[len(prefix):]}"
         
         # Fallback: return original path if no mount point matches
-        logger.warning("File path not under any configured mount point", file_path=str(file_path))
-        return str(file_path)
+        logger.warning("File path not under any configured mount point", file_path=path_str)
+        return path_str
         
-    def _load_processed_files(self):
-        """Load list of already processed files from Redis"""
-        try:
-            processed = self.redis_client.smembers('processed_files')
-            self.processed_files = {f.decode('utf-8') for f in processed}
-            logger.info("Loaded processed files", count=len(self.processed_files))
-        except Exception as e:
-            logger.error("Failed to load processed files", error=str(e))
+    def _is_supported_name(self, name: str) -> bool:
+        """Check if a file name or path string has a supported extension"""
+        i = name.rfind('.')
+        return i >= 0 and name[i:].lower() in self.SUPPORTED_EXTENSIONS
     
     def _is_supported_file(self, file_path: Path) -> bool:
         """Check if file has supported extension"""
-        return file_path.suffix.lower() in self.SUPPORTED_EXTENSIONS
+        return self._is_supported_name(file_path.name)
     
     def _get_file_hash(self, file_path: Path) -> str:
         """Calculate SHA-256 hash of file for duplicate detection"""
         try:
-            hash_sha256 = hashlib.sha256()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_sha256.update(chunk)
-            return hash_sha256.hexdigest()
+            with open(self._open_readonly(file_path), "rb", buffering=0) as f:
+                fd = f.fileno()
+                # Each file is read once, front to back: ask for aggressive readahead,
+                # then drop its pages so large videos do not evict the page cache
+                self._fadvise(fd, 'POSIX_FADV_SEQUENTIAL')
+                try:
+                    if hasattr(hashlib, 'file_digest'):
+                        # Python 3.11+: read and hash in C with the GIL released
+                        return hashlib.file_digest(f, 'sha256').hexdigest()
+                    
+                    # Fallback: hash a read-only mapping in 16 MiB slices to bound RSS;
+                    # the buffer is handed to OpenSSL without an intermediate bytes copy
+                    hash_sha256 = hashlib.sha256()
+                    size = os.fstat(fd).st_size
+                    if size:
+                        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                            for offset in range(0, size, HASH_SLICE_SIZE):
+                                hash_sha256.update(view[offset:offset + HASH_SLICE_SIZE])
+                                if hasattr(mmap, 'MADV_DONTNEED'):
+                                    mm.madvise(mmap.MADV_DONTNEED, offset, min(HASH_SLICE_SIZE, size - offset))
+                    return hash_sha256.hexdigest()
+                finally:
+                    self._fadvise(fd, 'POSIX_FADV_DONTNEED')
         except Exception as e:
             logger.error("Failed to calculate file hash", file_path=str(file_path), error=str(e))
             return ""
     
-    def _create_file_message(self, file_path: Path, event_type: str) -> Dict[str, Any]:
-        """Create message for file processing queue"""
+    def _fadvise(self, fd: int, advice: str):
+        """Best-effort posix_fadvise over a whole file; a no-op where unsupported"""
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(fd, 0, 0, getattr(os, advice))
+            except OSError:
+                pass
+    
+    def _open_readonly(self, file_path: Path) -> int:
+        """Open a file descriptor for reading, without updating atime when allowed"""
+        if O_NOATIME:
+            try:
+                return os.open(file_path, os.O_RDONLY | O_NOATIME)
+            except PermissionError:
+                pass
+        return os.open(file_path, os.O_RDONLY)
+    
+    def _hash_files_batch(self, files: List[Tuple[Path, str]]) -> List[str]:
+        """Hash several files concurrently, returning digests in input order"""
+        if len(files) < 4:
+            return [self._get_file_hash(file_path) for file_path, _ in files]
+        
+        # Start the largest files first so one big video does not begin last and
+        # leave the other workers idle; sizes come from the size:mtime fingerprint
+        order = sorted(range(len(files)), key=lambda i: int(files[i][1].split(':', 1)[0]), reverse=True)
+        futures = {i: self._hash_pool.submit(self._get_file_hash, files[i][0]) for i in order}
+        return [futures[i].result() for i in range(len(files))]
+    
+    def _get_file_fingerprint(self, stat: os.stat_result) -> str:
+        """Cheap change detector built from file size and modification time"""
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    
+    def _format_timestamp(self, timestamp: float) -> str:
+        """Format a Unix timestamp as a second-precision ISO 8601 UTC string for Solr"""
+        return time.strftime(ISO_UTC_FORMAT, time.gmtime(timestamp))
+    
+    def _queued_at(self) -> str:
+        """Current time for queued_at, formatted at most once per second"""
+        now = int(time.time())
+        second, formatted = self._queued_at_cache
+        if second != now:
+            formatted = self._format_timestamp(now)
+            self._queued_at_cache = (now, formatted)
+        return formatted
+    
+    def _create_file_message(self, file_path: Path, event_type: str, 
+                             stat: Optional[os.stat_result] = None, 
+                             file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Create message for file processing queue, reusing a stat result and hash when given
+        
+        Pass file_hash="" to leave hashing to the consumer.
+        """
+        if event_type == 'deleted':
+            return self._create_deleted_message(file_path)
+        
         try:
-            stat = file_path.stat()
-            file_hash = self._get_file_hash(file_path) if event_type != 'deleted' else ""
+            if stat is None:
+                stat = os.stat(file_path)
+            if file_hash is None:
+                file_hash = self._get_file_hash(file_path)
             
-            # Get standardized path for indexing
+            # Get standardized path for indexing; it is always '/'-separated, so the
+            # directory and depth come from plain string operations
             standardized_path = self._get_standardized_path(file_path)
-            standardized_dir = str(Path(standardized_path).parent)
             
             return {
                 'event_type': event_type,
                 'file_path': standardized_path,  # Use standardized path for indexing
                 'container_path': str(file_path),  # Keep original container path for file operations
                 'file_name': file_path.name,
-                'file_size': stat.st_size if event_type != 'deleted' else 0,
+                'file_size': stat.st_size,
                 'file_extension': file_path.suffix.lower(),
                 'content_hash': file_hash,
-                'created_date': datetime.fromtimestamp(stat.st_ctime).isoformat() + 'Z' if event_type != 'deleted' else None,
-                'modified_date': datetime.fromtimestamp(stat.st_mtime).isoformat() + 'Z' if event_type != 'deleted' else None,
-                'directory_path': standardized_dir,  # Use standardized directory path
-                'directory_depth': len(Path(standardized_path).parts) - 2,  # Depth from volume root
-                'queued_at': datetime.utcnow().isoformat() + 'Z'
+                'content_hash_pending': not file_hash,  # Consumer hashes the file on arrival
+                'created_date': self._format_timestamp(stat.st_ctime),
+                'modified_date': self._format_timestamp(stat.st_mtime),
+                'directory_path': standardized_path.rpartition('/')[0] or '/',  # Use standardized directory path
+                'directory_depth': standardized_path.count('/') - 1,  # Depth from volume root
+                'queued_at': self._queued_at()
             }
         except Exception as e:
             logger.error("Failed to create file message", file_path=str(file_path), error=str(e))
             return {}
     
+    def _create_deleted_message(self, file_path: Path) -> Dict[str, Any]:
+        """Create message for a file that no longer exists, without touching the filesystem"""
+        standardized_path = self._get_standardized_path(file_path)
+        
+        return {
+            'event_type': 'deleted',
+            'file_path': standardized_path,
+            'container_path': str(file_path),
+            'file_name': file_path.name,
+            'file_size': 0,
+            'file_extension': file_path.suffix.lower(),
+            'content_hash': "",
+            'content_hash_pending': False,
+            'created_date': None,
+            'modified_date': None,
+            'directory_path': standardized_path.rpartition('/')[0] or '/',
+            'directory_depth': standardized_path.count('/') - 1,
+            'queued_at': self._queued_at()
+        }
+    
     def _queue_file_for_processing(self, file_path: Path, event_type: str):
-        """Add file to processing queue with proper deduplication"""
+        """Add a single file to the processing queue with proper deduplication"""
+        self._queue_files_for_processing([(file_path, event_type)])
+    
+    def _queue_files_for_processing(self, events: List[Tuple[Path, str]], compute_hash: bool = True):
+        """Add a batch of files to the processing queue, pipelining the Redis checks
+        
+        With compute_hash=False (initial scan) no file content is read; the content
+        hash and duplicate-content check are left to the metadata extractor.
+        """
+        if not events:
+            return
+        
+        locked: List[str] = []
         try:
-            file_str = str(file_path)
+            # One stat per existing file, shared by the fingerprint and the message;
+            # files that vanished since the event are dropped here
+            stated = []
+            for file_path, event_type in events:
+                stat = None
+                if event_type in ['created', 'modified']:
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        logger.debug("File no longer exists, skipping", file_path=str(file_path))
+                        continue
+                stated.append((file_path, event_type, stat))
             
-            # First check: Global processing lock per file path (longer duration)
-            global_lock_key = f"global_processing:{file_str}"
+            # First round-trip: one claim script per file checks the global processing
+            # lock, queue membership, last-processed time (2 hours) and the fingerprint
+            # recorded when the file was last indexed, taking the lock (30 minutes) if all pass
+            now = str(time.time())
+            fingerprints = [self._get_file_fingerprint(stat) if stat else "" for _, _, stat in stated]
+            pipe = self.redis_client.pipeline(transaction=False)
+            for (file_path, event_type, stat), fingerprint in zip(stated, fingerprints):
+                file_str = str(file_path)
+                self._claim_file(
+                    keys=[f"global_processing:{file_str}", 'queued_files', 
+                          f"processed:{file_str}", f"fprint:{file_str}"],
+                    args=[file_str, fingerprint, now, '1' if event_type in ['created', 'modified'] else '0'],
+                    client=pipe)
+            results = pipe.execute()
             
-            # Try to acquire a global processing lock (expires in 30 minutes)
-            if not self.redis_client.set(global_lock_key, "processing", nx=True, ex=1800):
-                logger.debug("File globally locked for processing", file_path=file_str)
-                return
+            candidates = []
+            for (file_path, event_type, stat), fingerprint, status in zip(stated, fingerprints, results):
+                file_str = str(file_path)
+                if status != b'claimed':
+                    logger.debug("Skipping file", file_path=file_str, reason=status.decode('utf-8'))
+                    continue
+                locked.append(file_str)
+                candidates.append((file_path, event_type, stat, fingerprint))
             
-            try:
-                # Second check: Skip if already in queue
-                if self.redis_client.sismember('queued_files', file_str):
-                    logger.debug("File already in queue", file_path=file_str)
-                    return
-                
-                # Third check: Skip if recently processed (for created/modified events)
-                if event_type in ['created', 'modified']:
-                    processed_key = f"processed:{file_str}"
-                    last_processed = self.redis_client.get(processed_key)
-                    if last_processed:
-                        # Check if file was processed recently (within last 2 hours)
-                        try:
-                            last_time = float(last_processed)
-                            if time.time() - last_time < 7200:  # 2 hours
-                                logger.debug("File processed recently, skipping", file_path=file_str)
-                                return
-                        except (ValueError, TypeError):
-                            pass
-                
-                # Fourth check: Use file content hash to detect identical files
-                if event_type in ['created', 'modified'] and file_path.exists():
-                    file_hash = self._get_file_hash(file_path)
-                    if file_hash:
-                        hash_key = f"file_hash:{file_hash}"
-                        existing_path = self.redis_client.get(hash_key)
-                        if existing_path and existing_path.decode('utf-8') != file_str:
-                            logger.debug("File with identical content already exists", 
-                                       file_path=file_str, 
-                                       existing_path=existing_path.decode('utf-8'))
-                            return
-                        # Store this file's hash
-                        self.redis_client.set(hash_key, file_str, ex=86400)  # 24 hours
+            # Hash small created/modified files to detect identical content under another path
+            def should_hash(stat):
+                return compute_hash and stat is not None and stat.st_size < INLINE_HASH_MAX_SIZE
+            
+            to_hash = [(file_path, fingerprint) for file_path, _, stat, fingerprint in candidates 
+                       if should_hash(stat)]
+            hashes = iter(self._hash_files_batch(to_hash))
+            hashed = [
+                (file_path, event_type, stat, fingerprint, next(hashes) if should_hash(stat) else "")
+                for file_path, event_type, stat, fingerprint in candidates
+            ]
+            
+            # Second round-trip: look up the owner of every content hash in one go
+            pipe = self.redis_client.pipeline(transaction=False)
+            for file_path, event_type, stat, fingerprint, file_hash in hashed:
+                if file_hash:
+                    pipe.get(f"file_hash:{file_hash}")
+            owners = iter(pipe.execute())
+            
+            to_queue = []
+            batch_owners: Dict[str, bytes] = {}  # hashes claimed earlier in this batch
+            for file_path, event_type, stat, fingerprint, file_hash in hashed:
+                file_str = str(file_path)
+                if file_hash:
+                    existing_path = next(owners)
+                    existing_path = batch_owners.get(file_hash, existing_path)
+                    if existing_path and existing_path.decode('utf-8') != file_str:
+                        logger.debug("File with identical content already exists", 
+                                   file_path=file_str, 
+                                   existing_path=existing_path.decode('utf-8'))
+                        continue
                 
-                # Use shorter-term queue lock for atomic queue operations
-                queue_key = f"queue_lock:{file_str}"
-                if not self.redis_client.set(queue_key, "queuing", nx=True, ex=60):
-                    logger.debug("File being queued by another process", file_path=file_str)
-                    return
+                # Reuse the digest computed above instead of reading the file again
+                message = self._create_file_message(file_path, event_type, stat, file_hash)
+                if not message:
+                    continue
+                # The extractor records it once the file is indexed, for the 'unchanged' check
+                message['fingerprint'] = fingerprint
                 
-                try:
-                    message = self._create_file_message(file_path, event_type)
-                    if not message:
-                        return
-                    
-                    # Add to Redis queue
-                    self.redis_client.lpush(self.processing_queue, json.dumps(message))
-                    
-                    # Mark as queued
-                    if event_type != 'deleted':
-                        self.redis_client.sadd('queued_files', file_str)
-                    
-                    logger.info("File queued for processing", 
-                               file_path=file_str, 
-                               event_type=event_type,
-                               file_size=message.get('file_size', 0),
-                               content_hash=message.get('content_hash', 'none'))
-                               
-                finally:
-                    # Release the queue lock
-                    self.redis_client.delete(queue_key)
-                    
-            finally:
-                # Keep the global lock until processing is complete
-                # The metadata extractor will release it
-                pass
+                if file_hash:
+                    batch_owners[file_hash] = file_str.encode('utf-8')
+                to_queue.append((file_str, event_type, fingerprint, file_hash, message))
+            
+            # Buffer the writes; _flush sends them as one pipeline once enough accumulate
+            with self._pipe_lock:
+                self._pipe_buf.extend(to_queue)
+            self._flush()
             
         except Exception as e:
-            logger.error("Failed to queue file", file_path=str(file_path), error=str(e))
+            logger.error("Failed to queue files", count=len(events), error=str(e))
             # Clean up locks on error
-            try:
-                self.redis_client.delete(f"global_processing:{file_str}")
-                self.redis_client.delete(f"queue_lock:{file_str}")
-            except:
-                pass
+            for file_str in locked:
+                self._release_lock(file_str)
     
-    def _schedule_debounced_event(self, file_path: Path, event_type: str):
-        """Schedule an event to be processed after debounce delay"""
-        file_str = str(file_path)
-        
-        with self.debounce_lock:
-            # Update or create pending event
-            self.pending_events[file_str] = {
-                'file_path': file_path,
-                'event_type': event_type,
-                'timestamp': time.time()
-            }
-            
-            # Schedule processing after delay
-            timer = threading.Timer(self.debounce_delay, self._process_debounced_event, [file_str])
-            timer.start()
-            
-            logger.debug("Scheduled debounced event", 
-                        file_path=file_str, 
-                        event_type=event_type,
-                        delay=self.debounce_delay)
-    
-    def _process_debounced_event(self, file_str: str):
-        """Process a debounced event after delay has passed"""
-        with self.debounce_lock:
-            if file_str not in self.pending_events:
-                # Event was cancelled or already processed
+    def _flush(self, force: bool = False):
+        """Push buffered messages, mark them queued and record content hashes"""
+        with self._pipe_lock:
+            if not self._pipe_buf:
                 return
-            
-            event_data = self.pending_events.pop(file_str)
-            
-        # Check if file still exists (for created/modified events)
-        file_path = event_data['file_path']
-        event_type = event_data['event_type']
-        
-        if event_type in ['created', 'modified']:
-            if not file_path.exists():
-                logger.debug("File no longer exists, skipping debounced event", file_path=file_str)
+            if (not force and len(self._pipe_buf) < self.flush_size and
+                    time.monotonic() - self._pipe_last_flush < self.flush_interval):
                 return
-                
-        # Check if this is the most recent event for this file
-        event_time = event_data['timestamp']
-        if time.time() - event_time > self.debounce_delay * 2:
-            logger.debug("Event too old, skipping", file_path=file_str)
+            buffered, self._pipe_buf = self._pipe_buf, []
+            self._pipe_last_flush = time.monotonic()
+        
+        try:
+            # The global lock already serializes queuing per file; it is kept until
+            # processing is complete and the metadata extractor will release it.
+            pipe = self.redis_client.pipeline(transaction=False)
+            for file_str, event_type, fingerprint, file_hash, message in buffered:
+                pipe.lpush(self.processing_queue, orjson.dumps(message))
+                if event_type != 'deleted':
+                    pipe.sadd('queued_files', file_str)
+                if file_hash:
+                    pipe.set(f"file_hash:{file_hash}", file_str, ex=86400)  # 24 hours
+            pipe.execute()
+        except Exception as e:
+            logger.error("Failed to flush queued files", count=len(buffered), error=str(e))
+            for file_str, *_ in buffered:
+                self._release_lock(file_str)
             return
+        
+        # One summary per flush; per-file detail only when debugging, since a scan
+        # flushes thousands of files at a time
+        logger.info("Files queued for processing", count=len(buffered))
+        if logger.isEnabledFor(logging.DEBUG):
+            for file_str, event_type, fingerprint, file_hash, message in buffered:
+                logger.debug("File queued for processing", 
+                            file_path=file_str, 
+                            event_type=event_type,
+                            file_size=message.get('file_size', 0),
+                            content_hash=message.get('content_hash', 'none'))
+    
+    def _release_lock(self, file_str: str):
+        """Release the global processing lock held for a file"""
+        try:
+            self.redis_client.delete(f"global_processing:{file_str}")
+        except:
+            pass
+    
+    def _enqueue_events(self, batch: List[Tuple[Path, str, float]]):
+        """Hand a batch of events to the drain thread, blocking the inotify reader while it is full"""
+        try:
+            # Backpressure: while we wait, further events wait in the kernel's inotify queue
+            self.event_queue.put(batch, timeout=self.enqueue_timeout)
+        except queue.Full:
+            # Lost deletes and modifications are not recovered by the rescan, so say so loudly
+            self.dropped_events += len(batch)
+            logger.error("Event queue full, dropping events", 
+                        count=len(batch), 
+                        total_dropped=self.dropped_events)
+    
+    def _drain_events(self):
+        """Drain the event queue, debounce per path and queue due events in batches"""
+        while True:
+            try:
+                items = []
+                try:
+                    items.extend(self.event_queue.get(timeout=0.1))
+                    while len(items) < self.batch_size:
+                        items.extend(self.event_queue.get_nowait())
+                except queue.Empty:
+                    pass
+                
+                deleted = []
+                for file_path, event_type, timestamp in items:
+                    # Update or create pending event; the latest event wins
+                    self.pending_events[str(file_path)] = {
+                        'file_path': file_path,
+                        'event_type': event_type,
+                        'timestamp': timestamp
+                    }
+                    if event_type == 'deleted':
+                        deleted.append(str(file_path))
+                
+                # Remove deleted files from tracking sets immediately (no need to debounce cleanup)
+                if deleted:
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    for file_str in deleted:
+                        # processed_files holds standardized paths, the rest container paths
+                        pipe.srem('processed_files', self._get_standardized_path(file_str))
+                        pipe.srem('queued_files', file_str)
+                        pipe.delete(f"fprint:{file_str}")
+                    pipe.execute()
+                
+                due = self._pop_due_events()
+                if due:
+                    self._queue_files_for_processing(due)
+                
+                # Time-based flush so a partial buffer never waits for more events
+                self._flush()
+                    
+            except Exception as e:
+                logger.error("Event drain error", error=str(e))
+    
+    def _pop_due_events(self) -> List[Tuple[Path, str]]:
+        """Pop pending events that have been quiet for the debounce delay"""
+        now = time.monotonic()
+        due = []
+        log_events = logger.isEnabledFor(logging.DEBUG)
+        for file_str, event_data in list(self.pending_events.items()):
+            if now - event_data['timestamp'] < self.debounce_delay:
+                continue
+            del self.pending_events[file_str]
             
-        logger.info("Processing debounced event", 
-                   file_path=file_str, 
-                   event_type=event_type,
-                   age=time.time() - event_time)
+            file_path = event_data['file_path']
+            event_type = event_data['event_type']
+            
+            if log_events:
+                logger.debug("Processing debounced event", 
+                            file_path=file_str, 
+                            event_type=event_type,
+                            age=now - event_data['timestamp'])
+            due.append((file_path, event_type))
         
-        # Process the event
-        self._queue_file_for_processing(file_path, event_type)
+        if due:
+            logger.info("Processing debounced events", count=len(due))
+        return due
     
-    def on_created(self, event: FileSystemEvent):
-        """Handle file creation events"""
-        if event.is_directory:
-            return
+    def _indexed_files_under(self, directory: str) -> List[str]:
+        """Container paths of processed or queued files below a directory no longer on disk"""
+        # processed_files holds standardized paths, queued_files container paths
+        standardized_dir = self._get_standardized_path(directory)
         
-        file_path = Path(event.src_path)
-        if self._is_supported_file(file_path):
+        paths = set()
+        for member in self.redis_client.sscan_iter('processed_files', count=1000,
+                                                   match=self._children_pattern(standardized_dir)):
+            paths.add(directory + member.decode('utf-8')[len(standardized_dir):])
+        for member in self.redis_client.sscan_iter('queued_files', count=1000,
+                                                   match=self._children_pattern(directory)):
+            paths.add(member.decode('utf-8'))
+        return sorted(paths)
+    
+    def _children_pattern(self, directory: str) -> str:
+        """SSCAN pattern matching every path below directory"""
+        return GLOB_SPECIAL_CHARS.sub(r'\\\1', directory) + '/*'
+    
+    def handle_events(self, events: List[Tuple[str, str]]):
+        """Handle the (path, event_type) pairs from one inotify read as a single batch"""
+        now = time.monotonic()
+        # Filter on the raw string so rejected events never allocate a Path
+        batch = [(Path(path), event_type, now) for path, event_type in events
+                 if self._is_supported_name(path)]
+        if batch:
             # Use debouncing to prevent duplicate events
-            self._schedule_debounced_event(file_path, 'created')
+            self._enqueue_events(batch)
+
+
+class InotifyObserver(threading.Thread):
+    """Recursive inotify watcher that feeds file events into a NASFileHandler in batches"""
+    
+    # CLOSE_WRITE fires once the writer has closed the file, so no settle delay is needed.
+    # CREATE is only used to pick up new directories.
+    WATCH_FLAGS = (flags.CLOSE_WRITE | flags.CREATE | flags.MOVED_TO |
+                   flags.MOVED_FROM | flags.DELETE)
+    
+    def __init__(self, event_handler: NASFileHandler):
+        super().__init__(daemon=True)
+        self.event_handler = event_handler
+        self.inotify = INotify()
+        self.watches: Dict[int, str] = {}  # watch descriptor -> directory path
+        self._moved_dirs: Dict[int, Tuple[str, float]] = {}  # move cookie -> (old path, time)
+        self._stop_event = threading.Event()
     
-    def on_modified(self, event: FileSystemEvent):
-        """Handle file modification events"""
-        if event.is_directory:
+    def schedule(self, path: str):
+        """Watch a directory tree recursively"""
+        self._add_watch_recursive(path)
+    
+    def _add_watch_recursive(self, root: str):
+        """Add watches for root and every directory below it"""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                wd = self.inotify.add_watch(directory, self.WATCH_FLAGS)
+                self.watches[wd] = directory
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError as e:
+                # ENOSPC here means fs.inotify.max_user_watches is too low
+                logger.warning("Failed to watch directory", path=directory, error=str(e))
+    
+    def _remove_watches_under(self, root: str):
+        """Drop watches for a directory tree that moved out of its watched location"""
+        prefix = root + os.sep
+        for wd, directory in list(self.watches.items()):
+            if directory == root or directory.startswith(prefix):
+                del self.watches[wd]
+                try:
+                    self.inotify.rm_watch(wd)
+                except OSError:
+                    pass
+    
+    def _dispatch(self, event, batch: List[Tuple[str, str]]):
+        """Translate a raw inotify event into (path, event_type) pairs appended to batch"""
+        if event.mask & flags.Q_OVERFLOW:
+            # The rescan only queues files missing from processed_files, so lost deletes
+            # and modifications stay unindexed until those files change again
+            logger.error("inotify event queue overflowed, events were lost; "
+                        "raise fs.inotify.max_queued_events or reindex to recover")
+            return
+        if event.mask & flags.IGNORED:
+            self.watches.pop(event.wd, None)
             return
         
-        file_path = Path(event.src_path)
-        if self._is_supported_file(file_path):
-            # Wait a bit to ensure file is fully written
-            time.sleep(1)
-            if file_path.exists():
-                # Use debouncing to prevent duplicate events
-                self._schedule_debounced_event(file_path, 'modified')
-    
-    def on_deleted(self, event: FileSystemEvent):
-        """Handle file deletion events"""
-        if event.is_directory:
+        directory = self.watches.get(event.wd)
+        if directory is None or not event.name:
             return
+        path = os.path.join(directory, event.name)
         
-        file_path = Path(event.src_path)
-        if self._is_supported_file(file_path):
-            # Use debouncing to prevent duplicate events
-            self._schedule_debounced_event(file_path, 'deleted')
-            # Remove from processed files immediately (no need to debounce cleanup)
-            self.redis_client.srem('processed_files', str(file_path))
-            self.redis_client.srem('queued_files', str(file_path))
-    
-    def on_moved(self, event: FileSystemEvent):
-        """Handle file move/rename events"""
-        if event.is_directory:
+        if event.mask & flags.ISDIR:
+            if event.mask & (flags.CREATE | flags.MOVED_TO):
+                # A directory moved within the tree arrives as MOVED_FROM/MOVED_TO sharing a cookie
+                old_path = None
+                if event.mask & flags.MOVED_TO:
+                    old_path, _ = self._moved_dirs.pop(event.cookie, (None, 0))
+                
+                self._add_watch_recursive(path)
+                # Files that landed before the watch existed produce no events of their own;
+                # after a move, each file's old path is removed from the index
+                for root, _, files in os.walk(path):
+                    for name in files:
+                        new_file = os.path.join(root, name)
+                        if old_path is not None:
+                            batch.append((old_path + new_file[len(path):], 'deleted'))
+                        batch.append((new_file, 'created'))
+            elif event.mask & flags.MOVED_FROM:
+                self._remove_watches_under(path)
+                self._moved_dirs[event.cookie] = (path, time.monotonic())
             return
         
-        old_path = Path(event.src_path)
-        new_path = Path(event.dest_path)
-        
-        if self._is_supported_file(old_path) or self._is_supported_file(new_path):
-            # Handle as deletion of old path and creation of new path
-            if self._is_supported_file(old_path):
-                # Use debouncing to prevent duplicate events
-                self._schedule_debounced_event(old_path, 'deleted')
-            if self._is_supported_file(new_path) and new_path.exists():
-                # Use debouncing to prevent duplicate events
-                self._schedule_debounced_event(new_path, 'created')
-
+        if event.mask & flags.CLOSE_WRITE:
+            batch.append((path, 'modified'))
+        elif event.mask & flags.MOVED_TO:
+            batch.append((path, 'created'))
+        elif event.mask & (flags.DELETE | flags.MOVED_FROM):
+            batch.append((path, 'deleted'))
+    
+    def _expire_moved_dirs(self, batch: List[Tuple[str, str]]):
+        """Treat directories whose move never completed inside the tree as deleted"""
+        now = time.monotonic()
+        for cookie, (path, moved_at) in list(self._moved_dirs.items()):
+            if now - moved_at < MOVE_PAIR_TIMEOUT:
+                continue
+            del self._moved_dirs[cookie]
+            # The files are gone from disk, so Redis is the record of what was indexed
+            try:
+                for file_str in self.event_handler._indexed_files_under(path):
+                    batch.append((file_str, 'deleted'))
+            except Exception as e:
+                logger.error("Failed to remove files under moved directory", path=path, error=str(e))
+    
+    def run(self):
+        """Read inotify events until stopped"""
+        while not self._stop_event.is_set():
+            try:
+                # Wait up to 500ms for events, then 100ms more so bursts arrive in one read
+                batch: List[Tuple[str, str]] = []
+                for event in self.inotify.read(timeout=500, read_delay=100):
+                    self._dispatch(event, batch)
+                if self._moved_dirs:
+                    self._expire_moved_dirs(batch)
+                if batch:
+                    self.event_handler.handle_events(batch)
+            except Exception as e:
+                logger.error("inotify read error", error=str(e))
+    
+    def stop(self):
+        """Ask the watcher thread to exit after its current read"""
+        self._stop_event.set()
 
 class FileMonitorService:
     """Main file monitoring service"""
@@ -360,17 +708,54 @@ class FileMonitorService:
         self.mount_paths = os.getenv('MOUNT_PATHS', '/nas/test-data')
         self.redis_client = None
         self.observer = None
+        self.shutdown_event = threading.Event()
+        self.rescan_interval = 1800  # seconds between rescans for missed files
+        self.redis_max_connections = 8
+        self.scan_batch_size = 500  # files per processed_files membership check
+        self.hash_workers = int(os.getenv('HASH_WORKERS', DEFAULT_HASH_WORKERS))
         
     def connect_redis(self):
         """Connect to Redis"""
         try:
-            self.redis_client = redis.from_url(self.redis_url, decode_responses=False)
+            # The scan (main thread) and the drain thread pipeline concurrently, each on its
+            # own pooled connection; callers wait for a free one instead of failing.
+            # from_url also accepts unix:///path/to/redis.sock when Redis runs on the same host
+            pool = redis.BlockingConnectionPool.from_url(
+                self.redis_url, max_connections=self.redis_max_connections, timeout=30)
+            self.redis_client = redis.Redis(connection_pool=pool)
             self.redis_client.ping()
-            logger.info("Connected to Redis", redis_url=self.redis_url)
+            logger.info("Connected to Redis", 
+                       redis_url=self.redis_url, 
+                       transport='unix' if self.redis_url.startswith('unix://') else 'tcp', 
+                       parser='hiredis' if HIREDIS_AVAILABLE else 'python')
         except Exception as e:
             logger.error("Failed to connect to Redis", error=str(e))
             raise
     
+    def _walk_files(self, root: str) -> Iterator[os.DirEntry]:
+        """Yield regular files below root using os.scandir's cached entry types"""
+        # Explicit stack: no generator chain per directory level and no recursion limit
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry
+            except OSError as e:
+                logger.warning("Failed to scan directory", path=directory, error=str(e))
+    
+    def _queue_unprocessed(self, event_handler, batch: List[Tuple[Path, str]]) -> int:
+        """Queue the files in a scan batch that are not yet in processed_files"""
+        processed = self.redis_client.smismember('processed_files', [path for _, path in batch])
+        to_queue = [(file_path, 'created') for (file_path, _), seen in zip(batch, processed) if not seen]
+        # Metadata-only traversal: content is hashed later by the extractor
+        event_handler._queue_files_for_processing(to_queue, compute_hash=False)
+        return len(to_queue)
+    
     def scan_existing_files(self, event_handler):
         """Scan existing files on startup"""
         logger.info("Starting initial file scan", mount_paths=self.mount_paths)
@@ -389,27 +774,37 @@ class FileMonitorService:
                     logger.warning("Mount path does not exist", volume=volume_name, path=str(mount_path))
                     continue
                 
-                for file_path in mount_path.rglob('*'):
-                    if file_path.is_file():
-                        total_files += 1
-                        volume_files += 1
+                # Bind the per-entry helpers once; this loop runs for every file on the volume
+                is_supported = event_handler._is_supported_name
+                standardize = event_handler._get_standardized_path
+                batch_size = self.scan_batch_size
+                
+                batch: List[Tuple[Path, str]] = []
+                for entry in self._walk_files(str(mount_path)):
+                    total_files += 1
+                    volume_files += 1
+                    
+                    # Check if file is supported, deferring the processed check to a batch
+                    if is_supported(entry.name):
+                        # Use standardized path for processing check
+                        batch.append((Path(entry.path), standardize(entry.path)))
                         
-                        # Check if file is supported and not already processed
-                        if event_handler._is_supported_file(file_path):
-                            # Use standardized path for processing check
-                            standardized_path = event_handler._get_standardized_path(file_path)
-                            
-                            # Check if already processed
-                            if standardized_path not in event_handler.processed_files:
-                                event_handler._queue_file_for_processing(file_path, 'created')
-                                processed_files += 1
-                                volume_processed += 1
+                        if len(batch) >= batch_size:
+                            volume_processed += self._queue_unprocessed(event_handler, batch)
+                            batch = []
+                
+                if batch:
+                    volume_processed += self._queue_unprocessed(event_handler, batch)
+                processed_files += volume_processed
                 
                 logger.info("Volume scan completed", 
                            volume=volume_name,
                            total_files=volume_files, 
                            queued_files=volume_processed)
             
+            # Push whatever is still buffered from the last scan batch
+            event_handler._flush(force=True)
+            
             logger.info("Initial file scan completed", 
                        total_files=total_files, 
                        queued_files=processed_files)
@@ -420,7 +815,7 @@ class FileMonitorService:
     def start_monitoring(self):
         """Start filesystem monitoring"""
         # Create event handler with multiple mount paths
-        event_handler = NASFileHandler(self.redis_client, self.mount_paths)
+        event_handler = NASFileHandler(self.redis_client, self.mount_paths, self.hash_workers)
         
         # Validate all mount paths exist
         all_paths_valid = True
@@ -435,36 +830,58 @@ class FileMonitorService:
         # Perform initial scan of existing files
         self.scan_existing_files(event_handler)
         
-        # Set up observer for each mount point
-        self.observer = Observer()
+        # Set up inotify watches for each mount point
+        self.observer = InotifyObserver(event_handler)
         for volume_name, mount_path in event_handler.mount_points.items():
-            self.observer.schedule(event_handler, str(mount_path), recursive=True)
+            self.observer.schedule(str(mount_path))
             logger.info("Watching mount point", volume=volume_name, path=str(mount_path))
         
         # Start monitoring
         self.observer.start()
         logger.info("Started file monitoring", mount_paths=self.mount_paths)
         
-        try:
-            scan_counter = 0
-            while True:
-                time.sleep(1)
-                scan_counter += 1
-                
-                # Perform periodic rescan every 30 minutes (1800 seconds) to reduce duplicate processing
-                if scan_counter % 1800 == 0:
-                    logger.info("Performing periodic rescan for missed files")
-                    self.scan_existing_files(event_handler)
-                    
-        except KeyboardInterrupt:
-            logger.info("Shutting down file monitor")
-            self.observer.stop()
+        # Block in the kernel until SIGINT/SIGTERM, waking only for the periodic rescan
+        # every 30 minutes (1800 seconds) to reduce duplicate processing
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.shutdown_event.set())
         
+        while not self.shutdown_event.wait(self.rescan_interval):
+            logger.info("Performing periodic rescan for missed files")
+            self.scan_existing_files(event_handler)
+        
+        logger.info("Shutting down file monitor")
+        self.observer.stop()
         self.observer.join()
+        event_handler._flush(force=True)
+    
+    def log_hash_backend(self):
+        """Log which SHA-256 implementation file hashing will use"""
+        # OpenSSL's SHA-256 switches to SHA-NI / ARMv8 SHA2 instructions at runtime
+        # when the CPU has them; hashlib's builtin fallback never does
+        backend = 'openssl' if type(hashlib.sha256()).__module__ == '_hashlib' else 'builtin'
+        
+        cpu_sha_extensions = False
+        try:
+            with open('/proc/cpuinfo') as f:
+                cpu_flags = set()
+                for line in f:
+                    if line.startswith(('flags', 'Features')):
+                        cpu_flags.update(line.split(':', 1)[1].split())
+                cpu_sha_extensions = 'sha_ni' in cpu_flags or 'sha2' in cpu_flags
+        except OSError:
+            pass
+        
+        logger.info("File hashing backend", 
+                   backend=backend, 
+                   openssl_version=ssl.OPENSSL_VERSION, 
+                   cpu_sha_extensions=cpu_sha_extensions, 
+                   hash_workers=self.hash_workers, 
+                   gil_enabled=GIL_ENABLED)
     
     def run(self):
         """Main service entry point"""
         logger.info("Starting File Monitor Service")
+        self.log_hash_backend()
         
         try:
             self.connect_redis()
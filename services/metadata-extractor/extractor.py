@@ -4,21 +4,31 @@ Metadata Extractor Service - Processes files from the queue and extracts metadat
 """
 
 import os
-import json
+import re
 import time
-import subprocess
+import hashlib
+import http.client
+import multiprocessing
+import signal
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, BinaryIO, Callable, List, Optional, Tuple
 from datetime import datetime
+from fractions import Fraction
 from urllib.parse import urlparse
+from xml.sax.saxutils import escape
 
+import av
+import orjson
 import redis
 import requests
+from requests.adapters import HTTPAdapter
 import structlog
 import magic
 from PIL import Image
-from PIL.ExifTags import TAGS
-import exifread
+from PIL.ExifTags import Base, GPS, IFD
 from mutagen import File as AudioFile
 
 # Configure structured logging
@@ -42,171 +52,220 @@ structlog.configure(
 
 logger = structlog.get_logger()
 
+# Shared keep-alive connection pool for all Solr requests
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+# Bytes from the start of a file handed to libmagic for MIME detection
+MIME_SNIFF_BYTES = 16 * 1024
+
+# Characters of a text file indexed as content, and the chunk size used to count the rest
+TEXT_CONTENT_CHARS = 10000
+TEXT_COUNT_CHUNK_CHARS = 1024 * 1024
+
+# Documents larger than this are not sent to Tika, and how long to wait for its text
+TIKA_MAX_FILE_SIZE = 100 * 1024 * 1024
+TIKA_TIMEOUT = 120
+
+# Seconds stopping worker processes get to finish in-flight files (a Tika upload can
+# take TIKA_TIMEOUT) and send their last Solr batch; stop_grace_period must exceed it
+SHUTDOWN_TIMEOUT = TIKA_TIMEOUT + 30
+
+# In-process cache of recently checked indexed metadata, in front of the solr_meta:
+# hashes in Redis; short-lived so other extractor replicas' updates are picked up
+INDEXED_META_CACHE_SIZE = 4096
+INDEXED_META_CACHE_TTL = 300
+
+# Audio fields stored as numbers in Solr; tags like "3/12" or "2019-05-03" keep their leading number
+NUMERIC_AUDIO_FIELDS = frozenset({'track_number', 'year'})
+LEADING_NUMBER = re.compile(r'\d+')
+
+# High-level file type for each top-level MIME type
+MIME_FILE_TYPES = {'image': 'image', 'video': 'video', 'audio': 'audio', 'text': 'document'}
+
+# Extensions indexed as documents or archives whatever their MIME type
+TEXT_DOCUMENT_EXTENSIONS = frozenset({'.pdf', '.doc', '.docx', '.rtf', '.odt'})
+DOCUMENT_EXTENSIONS = TEXT_DOCUMENT_EXTENSIONS | {'.txt'}
+ARCHIVE_EXTENSIONS = frozenset({'.zip', '.rar', '.7z', '.tar', '.gz'})
+
+# Extensions the thumbnail generator handles
+THUMBNAIL_EXTENSIONS = frozenset({
+    '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp',
+    '.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpg', '.mpeg',
+})
+
+# Message fields that are not in the Solr schema, and date fields Solr needs in UTC
+SOLR_EXCLUDED_FIELDS = frozenset({'event_type', 'queued_at', 'format', 'fingerprint'})
+DATE_FIELDS = ('created_date', 'modified_date')
+
+# Extensions whose MIME type is unambiguous, using the names libmagic reports;
+# anything else is sniffed
+EXTENSION_MIME_TYPES = {
+    '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif',
+    '.tif': 'image/tiff', '.tiff': 'image/tiff', '.webp': 'image/webp',
+    '.mp4': 'video/mp4', '.mov': 'video/quicktime', '.mkv': 'video/x-matroska',
+    '.avi': 'video/x-msvideo', '.webm': 'video/webm',
+    '.mp3': 'audio/mpeg', '.flac': 'audio/flac', '.wav': 'audio/x-wav',
+    '.pdf': 'application/pdf', '.txt': 'text/plain',
+    '.zip': 'application/zip', '.gz': 'application/gzip',
+}
+
 
 class MetadataExtractor:
     """Extract metadata from various file types"""
     
-    def __init__(self, solr_url: str):
+    # Audio tag name (ID3, Vorbis comment, MP4 atom) -> metadata field; for each
+    # field the names are listed in priority order
+    AUDIO_TAG_FIELDS = {
+        'TPE1': 'artist', 'ARTIST': 'artist', '\xa9ART': 'artist',
+        'TALB': 'album', 'ALBUM': 'album', '\xa9alb': 'album',
+        'TIT2': 'title', 'TITLE': 'title', '\xa9nam': 'title',
+        'TCON': 'genre', 'GENRE': 'genre', '\xa9gen': 'genre',
+        'TDRC': 'year', 'DATE': 'year', '\xa9day': 'year',
+        'TRCK': 'track_number', 'TRACKNUMBER': 'track_number', 'trkn': 'track_number',
+    }
+    
+    def __init__(self, solr_url: str, tika_url: str = ''):
         self.solr_url = solr_url
-        self.magic = magic.Magic(mime=True)
+        self.tika_url = tika_url.rstrip('/')
+        self._tika_conn = None  # keep-alive connection for plain HTTP Tika uploads
+        self.magic = None  # loaded on first use, see _sniff_mime_type
         
-    def extract_image_metadata(self, file_path: Path) -> Dict[str, Any]:
-        """Extract metadata from image files"""
+    def extract_image_metadata(self, file_path: Path, f: BinaryIO) -> Dict[str, Any]:
+        """Extract metadata from image files, reading from the already open file f"""
         metadata = {}
         
         try:
             # Basic image info using PIL
-            with Image.open(file_path) as img:
+            f.seek(0)
+            with Image.open(f) as img:
                 metadata.update({
                     'width': img.width,
                     'height': img.height,
                     'color_space': img.mode,
                     'format': img.format
                 })
-            
-            # EXIF data using exifread
-            with open(file_path, 'rb') as f:
-                tags = exifread.process_file(f, details=False)
-                
-                # Camera info
-                if 'Image Make' in tags:
-                    metadata['camera_make'] = str(tags['Image Make'])
-                if 'Image Model' in tags:
-                    metadata['camera_model'] = str(tags['Image Model'])
-                if 'EXIF LensModel' in tags:
-                    metadata['lens_model'] = str(tags['EXIF LensModel'])
-                
-                # Camera settings
-                if 'EXIF FocalLength' in tags:
-                    focal_length = str(tags['EXIF FocalLength'])
-                    if '/' in focal_length:
-                        num, den = focal_length.split('/')
-                        metadata['focal_length'] = float(num) / float(den)
-                
-                if 'EXIF FNumber' in tags:
-                    f_number = str(tags['EXIF FNumber'])
-                    if '/' in f_number:
-                        num, den = f_number.split('/')
-                        metadata['aperture'] = float(num) / float(den)
-                
-                if 'EXIF ISOSpeedRatings' in tags:
-                    metadata['iso_speed'] = int(str(tags['EXIF ISOSpeedRatings']))
-                
-                if 'EXIF ExposureTime' in tags:
-                    metadata['shutter_speed'] = str(tags['EXIF ExposureTime'])
-                
-                if 'EXIF Flash' in tags:
-                    try:
-                        flash_value = str(tags['EXIF Flash'])
-                        # Try to parse as integer, fallback to detecting keywords
-                        try:
-                            metadata['flash'] = int(flash_value) > 0
-                        except ValueError:
-                            # Parse text descriptions like "Flash did not fire"
-                            metadata['flash'] = 'fire' in flash_value.lower()
-                    except:
-                        metadata['flash'] = False
                 
-                # GPS data
-                if 'GPS GPSLatitude' in tags and 'GPS GPSLongitude' in tags:
-                    lat_ref = str(tags.get('GPS GPSLatitudeRef', 'N'))
-                    lon_ref = str(tags.get('GPS GPSLongitudeRef', 'E'))
-                    
-                    # Convert GPS coordinates
-                    lat = self._convert_gps_coord(str(tags['GPS GPSLatitude']))
-                    lon = self._convert_gps_coord(str(tags['GPS GPSLongitude']))
-                    
-                    if lat and lon:
-                        if lat_ref == 'S':
-                            lat = -lat
-                        if lon_ref == 'W':
-                            lon = -lon
-                        metadata['gps_location'] = f"{lat},{lon}"
+                # EXIF data from the segment PIL already read with the headers; each
+                # IFD is only parsed when it is asked for
+                exif = img.getexif()
+                exif_ifd = exif.get_ifd(IFD.Exif)
+                gps_ifd = exif.get_ifd(IFD.GPSInfo)
+            
+            # Camera info
+            for field, value in (('camera_make', exif.get(Base.Make)),
+                                 ('camera_model', exif.get(Base.Model)),
+                                 ('lens_model', exif_ifd.get(Base.LensModel))):
+                if isinstance(value, str) and value.strip():
+                    metadata[field] = value.strip()
+            
+            # Camera settings, read from the numeric tag values
+            focal_length = self._ratio_value(exif_ifd.get(Base.FocalLength))
+            if focal_length is not None:
+                metadata['focal_length'] = focal_length
+            
+            f_number = self._ratio_value(exif_ifd.get(Base.FNumber))
+            if f_number is not None:
+                metadata['aperture'] = f_number
+            
+            iso_speed = exif_ifd.get(Base.ISOSpeedRatings)
+            if isinstance(iso_speed, tuple):
+                iso_speed = iso_speed[0] if iso_speed else None
+            if iso_speed is not None:
+                metadata['iso_speed'] = int(iso_speed)
+            
+            exposure_time = exif_ifd.get(Base.ExposureTime)
+            if exposure_time is not None:
+                try:
+                    # Keep the "1/200" form rather than a decimal
+                    metadata['shutter_speed'] = str(Fraction(exposure_time.numerator, exposure_time.denominator))
+                except (AttributeError, ZeroDivisionError):
+                    pass
+            
+            flash = exif_ifd.get(Base.Flash)
+            if flash is not None:
+                # Bit 0 of the Flash tag records whether the flash fired
+                metadata['flash'] = bool(int(flash) & 1)
+            
+            # GPS data
+            if GPS.GPSLatitude in gps_ifd and GPS.GPSLongitude in gps_ifd:
+                lat_ref = str(gps_ifd.get(GPS.GPSLatitudeRef, 'N')).strip()
+                lon_ref = str(gps_ifd.get(GPS.GPSLongitudeRef, 'E')).strip()
                 
-                if 'GPS GPSAltitude' in tags:
-                    altitude = str(tags['GPS GPSAltitude'])
-                    if '/' in altitude:
-                        num, den = altitude.split('/')
-                        metadata['gps_altitude'] = float(num) / float(den)
+                # Convert GPS coordinates
+                lat = self._convert_gps_coord(gps_ifd[GPS.GPSLatitude])
+                lon = self._convert_gps_coord(gps_ifd[GPS.GPSLongitude])
                 
+                if lat is not None and lon is not None:
+                    if lat_ref == 'S':
+                        lat = -lat
+                    if lon_ref == 'W':
+                        lon = -lon
+                    metadata['gps_location'] = f"{lat},{lon}"
+            
+            altitude = self._ratio_value(gps_ifd.get(GPS.GPSAltitude))
+            if altitude is not None:
+                metadata['gps_altitude'] = altitude
+            
         except Exception as e:
             logger.error("Failed to extract image metadata", file_path=str(file_path), error=str(e))
         
         return metadata
     
-    def _convert_gps_coord(self, coord_str: str) -> Optional[float]:
-        """Convert GPS coordinate from EXIF format to decimal degrees"""
+    def _convert_gps_coord(self, values) -> Optional[float]:
+        """Convert GPS coordinate from EXIF rationals to decimal degrees"""
         try:
-            # Format: [degrees, minutes, seconds]
-            parts = coord_str.strip('[]').split(', ')
-            if len(parts) == 3:
-                degrees = float(parts[0])
-                minutes = float(parts[1])
-                seconds = float(parts[2])
-                return degrees + minutes/60 + seconds/3600
-        except:
-            pass
-        return None
+            # (degrees, minutes, seconds) as rationals; sum them as exact fractions
+            # so the only float division happens once at the end
+            degrees, minutes, seconds = (Fraction(v.numerator, v.denominator) for v in values)
+            return float(degrees + minutes / 60 + seconds / 3600)
+        except (AttributeError, ValueError, TypeError, ZeroDivisionError):
+            return None
+    
+    def _ratio_value(self, value) -> Optional[float]:
+        """Value of a rational EXIF tag as a float, or None if it is missing or undefined"""
+        try:
+            return float(Fraction(value.numerator, value.denominator))
+        except (AttributeError, ValueError, TypeError, ZeroDivisionError):
+            return None
     
     def extract_video_metadata(self, file_path: Path) -> Dict[str, Any]:
-        """Extract metadata from video files using ffprobe"""
+        """Extract metadata from video files by probing the container in-process with libav"""
         metadata = {}
         
         try:
-            cmd = [
-                'ffprobe', '-v', 'quiet', '-print_format', 'json',
-                '-show_format', '-show_streams', str(file_path)
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                
+            # Same probe ffprobe runs, without spawning a process per file; libav
+            # releases the GIL while it opens and probes the container
+            with av.open(str(file_path)) as container:
                 # Format info
-                if 'format' in data:
-                    fmt = data['format']
-                    if 'duration' in fmt:
-                        metadata['duration'] = int(float(fmt['duration']))
-                    if 'bit_rate' in fmt:
-                        metadata['bit_rate'] = int(fmt['bit_rate'])
+                if container.duration:
+                    metadata['duration'] = int(container.duration / av.time_base)
+                if container.bit_rate:
+                    metadata['bit_rate'] = container.bit_rate
                 
                 # Stream info
-                video_stream = None
-                audio_stream = None
-                
-                for stream in data.get('streams', []):
-                    if stream.get('codec_type') == 'video' and not video_stream:
-                        video_stream = stream
-                    elif stream.get('codec_type') == 'audio' and not audio_stream:
-                        audio_stream = stream
-                
-                if video_stream:
+                if container.streams.video:
+                    video_stream = container.streams.video[0]
+                    width = video_stream.codec_context.width
+                    height = video_stream.codec_context.height
                     metadata.update({
-                        'width': video_stream.get('width'),
-                        'height': video_stream.get('height'),
-                        'video_codec': video_stream.get('codec_name'),
-                        'frame_rate': self._parse_frame_rate(video_stream.get('r_frame_rate')),
-                        'resolution': f"{video_stream.get('width')}x{video_stream.get('height')}"
+                        'width': width,
+                        'height': height,
+                        'video_codec': video_stream.codec_context.name,
+                        'frame_rate': float(video_stream.base_rate) if video_stream.base_rate else None,
+                        'resolution': f"{width}x{height}"
                     })
                 
-                if audio_stream:
-                    metadata['audio_codec'] = audio_stream.get('codec_name')
+                if container.streams.audio:
+                    metadata['audio_codec'] = container.streams.audio[0].codec_context.name
                     
         except Exception as e:
             logger.error("Failed to extract video metadata", file_path=str(file_path), error=str(e))
         
         return metadata
     
-    def _parse_frame_rate(self, frame_rate_str: str) -> Optional[float]:
-        """Parse frame rate from ffprobe output"""
-        try:
-            if frame_rate_str and '/' in frame_rate_str:
-                num, den = frame_rate_str.split('/')
-                return float(num) / float(den)
-        except:
-            pass
-        return None
-    
     def extract_audio_metadata(self, file_path: Path) -> Dict[str, Any]:
         """Extract metadata from audio files"""
         metadata = {}
@@ -216,15 +275,14 @@ class MetadataExtractor:
             if audio_file is not None:
                 tags = audio_file.tags
                 if tags:
-                    # Common audio tags
-                    metadata.update({
-                        'artist': self._get_tag_value(tags, ['TPE1', 'ARTIST', '\xa9ART']),
-                        'album': self._get_tag_value(tags, ['TALB', 'ALBUM', '\xa9alb']),
-                        'title': self._get_tag_value(tags, ['TIT2', 'TITLE', '\xa9nam']),
-                        'genre': self._get_tag_value(tags, ['TCON', 'GENRE', '\xa9gen']),
-                        'year': self._get_tag_value(tags, ['TDRC', 'DATE', '\xa9day']),
-                        'track_number': self._get_tag_value(tags, ['TRCK', 'TRACKNUMBER', 'trkn'])
-                    })
+                    # Common audio tags, taking the first non-empty name for each field
+                    for tag_name, field in self.AUDIO_TAG_FIELDS.items():
+                        if field not in metadata and tag_name in tags:
+                            value = self._tag_value(tags[tag_name])
+                            if value is not None and field in NUMERIC_AUDIO_FIELDS:
+                                value = self._leading_number(value)
+                            if value is not None:
+                                metadata[field] = value
                 
                 # Duration
                 if hasattr(audio_file, 'info') and audio_file.info:
@@ -235,18 +293,18 @@ class MetadataExtractor:
         
         return metadata
     
-    def _get_tag_value(self, tags: Dict, tag_names: list) -> Optional[str]:
-        """Get tag value from various possible tag names"""
-        for tag_name in tag_names:
-            if tag_name in tags:
-                value = tags[tag_name]
-                if isinstance(value, list) and value:
-                    return str(value[0])
-                elif value:
-                    return str(value)
-        return None
-    
-    def extract_text_content(self, file_path: Path) -> Dict[str, Any]:
+    def _tag_value(self, value) -> Optional[str]:
+        """String form of an audio tag value, using the first entry of list values"""
+        if isinstance(value, list):
+            return str(value[0]) if value else None
+        return str(value) if value else None
+    
+    def _leading_number(self, value: str) -> Optional[int]:
+        """First number in a tag value, e.g. 3 for track "3/12" or "(3, 12)", or None if it has none"""
+        match = LEADING_NUMBER.search(value)
+        return int(match.group()) if match else None
+    
+    def extract_text_content(self, file_path: Path, mime_type: str) -> Dict[str, Any]:
         """Extract text content from text files and documents"""
         metadata = {}
         
@@ -256,48 +314,126 @@ class MetadataExtractor:
             if file_extension == '.txt':
                 # Read plain text files directly
                 with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    metadata['content'] = content[:10000]  # Limit to 10KB for indexing
-                    metadata['character_count'] = len(content)
-            elif file_extension in ['.pdf', '.doc', '.docx', '.rtf', '.odt']:
-                # Use Apache Tika for document extraction (would need Tika server)
-                # For now, just detect the document type
+                    content = f.read(TEXT_CONTENT_CHARS)
+                    metadata['content'] = content  # Limit to 10KB for indexing
+                    
+                    # Count the rest in bounded chunks rather than loading the whole file
+                    character_count = len(content)
+                    while chunk := f.read(TEXT_COUNT_CHUNK_CHARS):
+                        character_count += len(chunk)
+                    metadata['character_count'] = character_count
+            elif file_extension in TEXT_DOCUMENT_EXTENSIONS:
                 metadata['document_type'] = file_extension[1:]
                 
+                # Extract text with the Tika server when one is configured, skipping huge files
+                if self.tika_url and file_path.stat().st_size <= TIKA_MAX_FILE_SIZE:
+                    metadata.update(self.extract_document_text(file_path, mime_type))
+                
         except Exception as e:
             logger.error("Failed to extract text content", file_path=str(file_path), error=str(e))
         
         return metadata
     
+    def extract_document_text(self, file_path: Path, mime_type: str) -> Dict[str, Any]:
+        """Extract document text with Apache Tika over a keep-alive connection"""
+        metadata = {}
+        
+        try:
+            headers = {'Content-Type': mime_type, 'Accept': 'text/plain; charset=UTF-8'}
+            with open(file_path, 'rb') as f:
+                if self.tika_url.startswith('http://'):
+                    status_code, body = self._tika_sendfile(f, headers)
+                else:
+                    # TLS cannot use sendfile; stream the body through the shared session
+                    response = session.put(f"{self.tika_url}/tika", data=f, headers=headers,
+                                           timeout=TIKA_TIMEOUT)
+                    status_code, body = response.status_code, response.content
+            
+            if status_code != 200:
+                logger.warning("Tika text extraction failed", file_path=str(file_path),
+                             status_code=status_code)
+                return metadata
+            
+            content = body.decode('utf-8', errors='replace').strip()
+            if content:
+                metadata['content'] = content[:TEXT_CONTENT_CHARS]
+                metadata['character_count'] = len(content)
+                
+        except Exception as e:
+            logger.error("Failed to extract document text", file_path=str(file_path), error=str(e))
+        
+        return metadata
+    
+    def _tika_sendfile(self, f: BinaryIO, headers: Dict[str, str]) -> Tuple[int, bytes]:
+        """PUT an open file to Tika, letting the kernel copy it straight to the socket"""
+        size = os.fstat(f.fileno()).st_size
+        
+        # A keep-alive connection the server has since closed fails on first use; retry once
+        for attempt in range(2):
+            if self._tika_conn is None:
+                url = urlparse(self.tika_url)
+                self._tika_conn = http.client.HTTPConnection(url.hostname, url.port or 80,
+                                                             timeout=TIKA_TIMEOUT)
+            conn = self._tika_conn
+            try:
+                conn.putrequest('PUT', f"{urlparse(self.tika_url).path}/tika",
+                                skip_accept_encoding=True)
+                for name, value in {**headers, 'Content-Length': str(size)}.items():
+                    conn.putheader(name, value)
+                conn.endheaders()
+                
+                f.seek(0)
+                conn.sock.sendfile(f)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._tika_conn = None
+                if attempt:
+                    raise
+    
+    def _sniff_mime_type(self, f: BinaryIO) -> str:
+        """Detect the MIME type of an open file from its first bytes with libmagic"""
+        # Only threads that meet an unknown extension pay for loading the magic database
+        if self.magic is None:
+            self.magic = magic.Magic(mime=True)
+        return self.magic.from_buffer(f.read(MIME_SNIFF_BYTES))
+    
     def extract_metadata(self, file_path: Path) -> Dict[str, Any]:
         """Extract metadata based on file type"""
         metadata = {}
         
         try:
-            # Detect MIME type
-            mime_type = self.magic.from_file(str(file_path))
-            metadata['content_type'] = mime_type
-            
-            # Derive high-level file type for faceting
-            if mime_type.startswith('image/'):
-                metadata['file_type'] = 'image'
-                metadata.update(self.extract_image_metadata(file_path))
-            elif mime_type.startswith('video/'):
-                metadata['file_type'] = 'video'
-                metadata.update(self.extract_video_metadata(file_path))
-            elif mime_type.startswith('audio/'):
-                metadata['file_type'] = 'audio'
-                metadata.update(self.extract_audio_metadata(file_path))
-            elif mime_type.startswith('text/') or file_path.suffix.lower() in ['.txt', '.pdf', '.doc', '.docx', '.rtf', '.odt']:
-                metadata['file_type'] = 'document'
-                metadata.update(self.extract_text_content(file_path))
-            else:
-                # Default file type based on extension
+            # One open per file: sniff the MIME type from its head, and let image
+            # extraction reuse the handle and the pages it just read
+            with open(file_path, 'rb') as f:
+                # Detect MIME type, skipping libmagic for well-known extensions
+                mime_type = EXTENSION_MIME_TYPES.get(file_path.suffix.lower())
+                if mime_type is None:
+                    mime_type = self._sniff_mime_type(f)
+                metadata['content_type'] = mime_type
+                
+                # Derive high-level file type for faceting
                 ext = file_path.suffix.lower()
-                if ext in ['.zip', '.rar', '.7z', '.tar', '.gz']:
-                    metadata['file_type'] = 'archive'
-                else:
-                    metadata['file_type'] = 'other'
+                file_type = MIME_FILE_TYPES.get(mime_type.split('/', 1)[0])
+                if file_type is None:
+                    # Default file type based on extension
+                    if ext in DOCUMENT_EXTENSIONS:
+                        file_type = 'document'
+                    elif ext in ARCHIVE_EXTENSIONS:
+                        file_type = 'archive'
+                    else:
+                        file_type = 'other'
+                metadata['file_type'] = file_type
+                
+                if file_type == 'image':
+                    metadata.update(self.extract_image_metadata(file_path, f))
+                elif file_type == 'video':
+                    metadata.update(self.extract_video_metadata(file_path))
+                elif file_type == 'audio':
+                    metadata.update(self.extract_audio_metadata(file_path))
+                elif file_type == 'document':
+                    metadata.update(self.extract_text_content(file_path, mime_type))
             
         except Exception as e:
             logger.error("Failed to extract metadata", file_path=str(file_path), error=str(e))
@@ -305,16 +441,158 @@ class MetadataExtractor:
         return metadata
 
 
+class SolrBatcher:
+    """Buffer Solr adds and deletes and send them in batches with commitWithin"""
+    
+    def __init__(self, solr_url: str, redis_client, batch_size: int = 200, flush_interval: float = 2.0, 
+                 commit_within: int = 5000):
+        self.solr_url = solr_url
+        self.redis_client = redis_client  # completion callbacks queue their bookkeeping on its pipelines
+        self.batch_size = batch_size  # buffered updates that force a flush
+        self.flush_interval = flush_interval  # seconds before a partial buffer is flushed
+        self.commit_within = commit_within  # ms until Solr makes updates searchable
+        
+        # Ordered ('add', doc) / ('delete', query) operations with their completion callbacks
+        self._ops: List[Tuple[str, Any, Callable[[bool, Any], None]]] = []
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # keeps batches in order across flushing threads
+        self._stop = threading.Event()
+        
+        self._flush_thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flush_thread.start()
+    
+    def add(self, document: Dict[str, Any], on_done: Callable[[bool, Any], None]):
+        """Queue a document for indexing; on_done(success, pipe) runs once it has been sent"""
+        self._append('add', document, on_done)
+    
+    def delete(self, query: str, on_done: Callable[[bool, Any], None]):
+        """Queue a delete-by-query; on_done(success, pipe) runs once it has been sent"""
+        self._append('delete', query, on_done)
+    
+    def _append(self, kind: str, payload: Any, on_done: Callable[[bool, Any], None]):
+        with self._lock:
+            self._ops.append((kind, payload, on_done))
+            full = len(self._ops) >= self.batch_size
+        if full:
+            self.flush()
+    
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+    
+    def flush(self):
+        """Send everything buffered, preserving the order of adds and deletes"""
+        with self._send_lock:
+            with self._lock:
+                ops, self._ops = self._ops, []
+            
+            # Consecutive operations of the same kind go out as one request
+            start = 0
+            while start < len(ops):
+                kind = ops[start][0]
+                end = start
+                while end < len(ops) and ops[end][0] == kind:
+                    end += 1
+                run = ops[start:end]
+                results = self._send_run(kind, [payload for _, payload, _ in run])
+                
+                # The whole batch's Redis bookkeeping goes out in one round-trip
+                pipe = self.redis_client.pipeline(transaction=False)
+                for (_, _, on_done), success in zip(run, results):
+                    try:
+                        on_done(success, pipe)
+                    except Exception as e:
+                        logger.error("Solr batch callback failed", error=str(e))
+                try:
+                    pipe.execute()
+                except Exception as e:
+                    logger.error("Failed to record Solr batch in Redis", operation=kind, count=len(run), error=str(e))
+                start = end
+    
+    def stop(self):
+        """Stop the periodic flush, send whatever is still buffered and hard-commit it"""
+        self._stop.set()
+        self.flush()
+        
+        try:
+            response = session.post(f"{self.solr_url}/update?commit=true", data='<commit/>',
+                                    headers={'Content-Type': 'text/xml'})
+            if response.status_code != 200:
+                logger.error("Failed to commit Solr updates", status_code=response.status_code)
+        except Exception as e:
+            logger.error("Failed to commit Solr updates", error=str(e))
+    
+    def _send_run(self, kind: str, payloads: List[Any]) -> List[bool]:
+        """Send a run of operations of one kind, returning whether each was applied"""
+        status_code = self._send(kind, payloads)
+        if status_code == 200:
+            return [True] * len(payloads)
+        
+        # Solr rejects a whole update for one bad document; resend the adds one at a
+        # time so only the documents Solr refuses fail
+        if kind == 'add' and status_code is not None and 400 <= status_code < 500 and len(payloads) > 1:
+            logger.warning("Resending rejected Solr batch one document at a time", count=len(payloads))
+            return [self._send(kind, [payload]) == 200 for payload in payloads]
+        return [False] * len(payloads)
+    
+    def _send(self, kind: str, payloads: List[Any]) -> Optional[int]:
+        """Post one update request, returning its status code, or None if it could not be sent"""
+        try:
+            if kind == 'add':
+                response = session.post(
+                    f"{self.solr_url}/update?commitWithin={self.commit_within}",
+                    data=orjson.dumps(payloads),
+                    headers={'Content-Type': 'application/json'}
+                )
+            else:
+                queries = ''.join(f'<query>{escape(query)}</query>' for query in payloads)
+                response = session.post(
+                    f"{self.solr_url}/update?commitWithin={self.commit_within}",
+                    data=f'<delete>{queries}</delete>'.encode('utf-8'),
+                    headers={'Content-Type': 'text/xml'}
+                )
+            
+            if response.status_code == 200:
+                logger.info("Sent Solr batch", operation=kind, count=len(payloads))
+            else:
+                logger.error("Failed to send Solr batch", 
+                           operation=kind, 
+                           count=len(payloads), 
+                           status_code=response.status_code, 
+                           response=response.text)
+            return response.status_code
+            
+        except Exception as e:
+            logger.error("Solr batch error", operation=kind, count=len(payloads), error=str(e))
+            return None
+
+
 class MetadataExtractorService:
     """Main metadata extraction service"""
     
     def __init__(self):
         self.redis_url = os.getenv('REDIS_URL', 'redis://redis:6379')
         self.solr_url = os.getenv('SOLR_URL', 'http://solr:8983/solr/nas_content')
+        self.tika_url = os.getenv('TIKA_URL', '')  # document text extraction is skipped when unset
         self.processing_queue = 'file_processing_queue'
         self.thumbnail_queue = 'thumbnail_generation_queue'
         self.redis_client = None
         self.extractor = None
+        self.solr_batcher = None
+        
+        # Files are processed concurrently; extraction is dominated by file reads and
+        # container probing, both of which release the GIL
+        self.max_workers = int(os.getenv('MAX_WORKERS', '4'))
+        # Processes each running max_workers threads, for the CPU-bound parts (EXIF, PIL, JSON)
+        self.worker_processes = int(os.getenv('WORKER_PROCESSES', '1'))
+        self.shutdown_event = threading.Event()
+        self._local = threading.local()  # per-thread MetadataExtractor (libmagic is not thread-safe)
+        
+        # file_path -> (expires_at, indexed metadata), least recently used first; only
+        # with a single worker process, as another process's deletes would not reach it
+        self._meta_cache: OrderedDict = OrderedDict()
+        self._meta_cache_enabled = self.worker_processes == 1
+        self._meta_cache_lock = threading.Lock()
         
     def connect_redis(self):
         """Connect to Redis"""
@@ -328,8 +606,17 @@ class MetadataExtractorService:
     
     def initialize_extractor(self):
         """Initialize metadata extractor"""
-        self.extractor = MetadataExtractor(self.solr_url)
-        logger.info("Initialized metadata extractor", solr_url=self.solr_url)
+        self.extractor = MetadataExtractor(self.solr_url, self.tika_url)
+        self._local.extractor = self.extractor
+        self.solr_batcher = SolrBatcher(self.solr_url, self.redis_client)
+        logger.info("Initialized metadata extractor", solr_url=self.solr_url, max_workers=self.max_workers)
+    
+    def _get_extractor(self) -> MetadataExtractor:
+        """Return the calling thread's metadata extractor, creating it on first use"""
+        extractor = getattr(self._local, 'extractor', None)
+        if extractor is None:
+            extractor = self._local.extractor = MetadataExtractor(self.solr_url, self.tika_url)
+        return extractor
     
     def process_file(self, message: Dict[str, Any]) -> bool:
         """Process a single file message"""
@@ -341,12 +628,10 @@ class MetadataExtractorService:
             event_type = message['event_type']
             
             if event_type == 'deleted':
-                # Remove from Solr index using standardized path
-                success = self.delete_from_solr(standardized_path)
-                # Release the global processing lock
-                global_lock_key = f"global_processing:{standardized_path}"
-                self.redis_client.delete(global_lock_key)
-                return success
+                # Remove from Solr index using standardized path, then release the
+                # global processing lock once the delete has been sent
+                return self.delete_from_solr(standardized_path, 
+                                             on_done=lambda success, pipe: self._release_file(message, pipe))
             
             if not container_path.exists():
                 logger.warning("File no longer exists", 
@@ -355,14 +640,17 @@ class MetadataExtractorService:
                 return True
             
             # Extract metadata from actual file
-            metadata = self.extractor.extract_metadata(container_path)
+            metadata = self._get_extractor().extract_metadata(container_path)
             
             # Combine with file message data
             document = {**message, **metadata}
             
+            # The monitor skips hashing during scans and for large files
+            if document.pop('content_hash_pending', False):
+                document['content_hash'] = self.compute_content_hash(container_path)
+            
             # Create deterministic document ID based on standardized path
             # This ensures the same file always gets the same ID, allowing updates to overwrite
-            import hashlib
             deterministic_id = hashlib.sha256(standardized_path.encode()).hexdigest()
             document['id'] = deterministic_id
             document['processing_status'] = 'completed'
@@ -371,51 +659,93 @@ class MetadataExtractorService:
             document.pop('container_path', None)
             
             # Fix date formats for Solr (ISO format with Z suffix)
-            for date_field in ['created_date', 'modified_date']:
+            for date_field in DATE_FIELDS:
                 if date_field in document and document[date_field]:
                     date_str = document[date_field]
                     if not date_str.endswith('Z'):
                         document[date_field] = date_str + 'Z'
             
-            # Index in Solr
-            success = self.index_in_solr(document)
-            
-            if success:
-                # Mark as processed with timestamp using standardized path
-                processed_key = f"processed:{standardized_path}"
-                self.redis_client.set(processed_key, str(time.time()), ex=86400)  # Expire after 24 hours
-                self.redis_client.sadd('processed_files', standardized_path)
-                self.redis_client.srem('queued_files', standardized_path)
-                
-                # Release the global processing lock
-                global_lock_key = f"global_processing:{standardized_path}"
-                self.redis_client.delete(global_lock_key)
-                
-                # Trigger thumbnail generation for supported files
-                self.trigger_thumbnail_generation(message)
-                
-                logger.info("File processed successfully", 
-                           standardized_path=standardized_path,
-                           container_path=str(container_path))
-            else:
-                # Release the global processing lock even on failure
-                global_lock_key = f"global_processing:{standardized_path}"
-                self.redis_client.delete(global_lock_key)
-            
-            return success
+            # Index in Solr; bookkeeping runs once the batch holding the document is sent
+            if not self.index_in_solr(document, 
+                                      on_done=lambda success, pipe: self._finish_file(message, success, pipe)):
+                self._abandon_file(message)
+                return False
+            return True
             
         except Exception as e:
             logger.error("Failed to process file", message=message, error=str(e))
-            # Release the global processing lock on exception
-            try:
-                standardized_path = message.get('file_path')
-                if standardized_path:
-                    global_lock_key = f"global_processing:{standardized_path}"
-                    self.redis_client.delete(global_lock_key)
-            except:
-                pass
+            self._abandon_file(message)
             return False
     
+    def _finish_file(self, message: Dict[str, Any], success: bool, pipe):
+        """Queue the bookkeeping for a file's indexing outcome on pipe, releasing its processing lock"""
+        standardized_path = message['file_path']
+        
+        if success:
+            # Mark as processed with timestamp using standardized path
+            processed_key = f"processed:{standardized_path}"
+            pipe.set(processed_key, str(time.time()), ex=86400)  # Expire after 24 hours
+            pipe.sadd('processed_files', standardized_path)
+            
+            # Let the monitor skip the file until its size or mtime changes; keyed by the
+            # container path, as the monitor's claim script looks it up
+            if message.get('fingerprint'):
+                container_path = message.get('container_path', standardized_path)
+                pipe.set(f"fprint:{container_path}", message['fingerprint'], ex=604800)  # 7 days
+            
+            # Trigger thumbnail generation for supported files
+            self.trigger_thumbnail_generation(message, pipe)
+            
+            # Release the global processing lock
+            self._release_file(message, pipe)
+        else:
+            # Not indexed: let the monitor's next rescan queue the file again
+            self._forget_queued(message, pipe)
+        
+        if success:
+            logger.info("File processed successfully", 
+                       standardized_path=standardized_path,
+                       container_path=message.get('container_path'))
+        else:
+            logger.error("File processing failed", message=message)
+    
+    def _release_file(self, message: Dict[str, Any], pipe):
+        """Queue removal of a file's queued state on pipe, releasing its processing locks"""
+        standardized_path = message.get('file_path')
+        if not standardized_path:
+            return
+        # The monitor tracks queued files and its lock by container path
+        container_path = message.get('container_path', standardized_path)
+        pipe.srem('queued_files', standardized_path, container_path)
+        pipe.delete(f"global_processing:{standardized_path}",
+                    f"global_processing:{container_path}")
+    
+    def _forget_queued(self, message: Dict[str, Any], pipe):
+        """Queue removal of a file's queued state and fingerprint on pipe, releasing its locks"""
+        standardized_path = message.get('file_path')
+        if not standardized_path:
+            return
+        self._release_file(message, pipe)
+        pipe.delete(f"fprint:{message.get('container_path', standardized_path)}")
+    
+    def _abandon_file(self, message: Dict[str, Any]):
+        """Forget a file that could not be processed, so the periodic rescan queues it again"""
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            self._forget_queued(message, pipe)
+            pipe.execute()
+        except Exception as e:
+            logger.error("Failed to release abandoned file", file_path=message.get('file_path'), error=str(e))
+    
+    def compute_content_hash(self, file_path: Path) -> str:
+        """Calculate SHA-256 hash of a file the monitor queued without one"""
+        try:
+            with open(file_path, 'rb', buffering=0) as f:
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+        except Exception as e:
+            logger.error("Failed to calculate content hash", file_path=str(file_path), error=str(e))
+            return ""
+    
     def check_if_update_needed(self, document: Dict[str, Any]) -> bool:
         """Check if document needs to be updated in Solr"""
         try:
@@ -427,33 +757,41 @@ class MetadataExtractorService:
             if not file_path:
                 return True
             
-            # Query existing document from Solr by file_path (since we now use deterministic IDs)
-            response = requests.get(
-                f"{self.solr_url}/select",
-                params={
-                    'q': f'file_path:"{file_path}"',
-                    'fl': 'content_hash,modified_date,file_size',
-                    'wt': 'json'
-                }
-            )
-            
-            if response.status_code != 200:
-                logger.warning("Failed to query Solr for existing document", file_path=file_path)
-                return True
-            
-            data = response.json()
-            if data['response']['numFound'] == 0:
-                # Document doesn't exist, needs indexing
-                logger.info("Document not found in Solr, needs indexing", file_path=file_path)
-                return True
-            
-            if data['response']['numFound'] > 1:
-                # Multiple documents found - this shouldn't happen with deterministic IDs
-                logger.warning("Multiple documents found for file_path, will reindex", 
-                             file_path=file_path, count=data['response']['numFound'])
-                return True
+            # What was last indexed for this path, from Redis before asking Solr
+            existing_doc = self._get_indexed_meta(file_path)
+            if existing_doc is None:
+                # Query existing document from Solr by file_path (since we now use deterministic IDs);
+                # a term filter needs no escaping and skips analysis and scoring
+                response = session.get(
+                    f"{self.solr_url}/select",
+                    params={
+                        'q': '*:*',
+                        'fq': f'{{!term f=file_path}}{file_path}',
+                        'fl': 'content_hash,modified_date,file_size',
+                        'rows': 1,
+                        'wt': 'json'
+                    }
+                )
+                
+                if response.status_code != 200:
+                    logger.warning("Failed to query Solr for existing document", file_path=file_path)
+                    return True
+                
+                data = orjson.loads(response.content)
+                if data['response']['numFound'] == 0:
+                    # Document doesn't exist, needs indexing
+                    logger.info("Document not found in Solr, needs indexing", file_path=file_path)
+                    return True
+                
+                if data['response']['numFound'] > 1:
+                    # Multiple documents found - this shouldn't happen with deterministic IDs
+                    logger.warning("Multiple documents found for file_path, will reindex", 
+                                 file_path=file_path, count=data['response']['numFound'])
+                    return True
+                
+                existing_doc = data['response']['docs'][0]
+                self._remember_indexed_meta(file_path, existing_doc)
             
-            existing_doc = data['response']['docs'][0]
             existing_hash = existing_doc.get('content_hash')
             existing_modified = existing_doc.get('modified_date')
             existing_size = existing_doc.get('file_size')
@@ -488,119 +826,257 @@ class MetadataExtractorService:
                           file_path=document.get('file_path'), error=str(e))
             return True
 
-    def index_in_solr(self, document: Dict[str, Any]) -> bool:
-        """Index document in Solr"""
+    def _get_indexed_meta(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """Cached content_hash/modified_date/file_size of the indexed document, if known"""
+        # Bursts of events for the same path are answered from memory
+        with self._meta_cache_lock:
+            cached = self._meta_cache.get(file_path)
+            if cached is not None:
+                expires_at, meta = cached
+                if expires_at > time.monotonic():
+                    self._meta_cache.move_to_end(file_path)
+                    return meta
+                del self._meta_cache[file_path]
+        
+        try:
+            content_hash, modified_date, file_size = self.redis_client.hmget(
+                f"solr_meta:{file_path}", 'content_hash', 'modified_date', 'file_size')
+        except Exception as e:
+            logger.warning("Failed to read cached Solr metadata", file_path=file_path, error=str(e))
+            return None
+        
+        if modified_date is None and file_size is None:
+            return None
+        meta = {
+            'content_hash': content_hash or None,
+            'modified_date': modified_date or None,
+            'file_size': int(file_size) if file_size else None
+        }
+        self._cache_indexed_meta(file_path, meta)
+        return meta
+    
+    def _cache_indexed_meta(self, file_path: str, meta: Optional[Dict[str, Any]]):
+        """Store (or with None, forget) indexed metadata in the in-process cache"""
+        if not self._meta_cache_enabled:
+            return
+        with self._meta_cache_lock:
+            if meta is None:
+                self._meta_cache.pop(file_path, None)
+                return
+            self._meta_cache[file_path] = (time.monotonic() + INDEXED_META_CACHE_TTL, meta)
+            self._meta_cache.move_to_end(file_path)
+            if len(self._meta_cache) > INDEXED_META_CACHE_SIZE:
+                self._meta_cache.popitem(last=False)
+    
+    def _remember_indexed_meta(self, file_path: str, document: Dict[str, Any], pipe=None):
+        """Cache the fields check_if_update_needed compares for 24 hours, queuing on pipe when given"""
+        self._cache_indexed_meta(file_path, {
+            field: document.get(field) for field in ('content_hash', 'modified_date', 'file_size')
+        })
+        try:
+            key = f"solr_meta:{file_path}"
+            target = pipe or self.redis_client.pipeline(transaction=False)
+            target.delete(key)
+            target.hset(key, mapping={
+                field: document.get(field) or ''
+                for field in ('content_hash', 'modified_date', 'file_size')
+            })
+            target.expire(key, 86400)
+            if pipe is None:
+                target.execute()
+        except Exception as e:
+            logger.warning("Failed to cache Solr metadata", file_path=file_path, error=str(e))
+    
+    def index_in_solr(self, document: Dict[str, Any], on_done: Callable[[bool, Any], None]) -> bool:
+        """Queue document for batched indexing in Solr; on_done(success, pipe) runs once it is sent"""
         try:
             # Check if update is actually needed
             if not self.check_if_update_needed(document):
-                return True  # Return success since document is already up to date
-            
-            # Fields that should not be sent to Solr (not in our schema)
-            excluded_fields = {'event_type', 'queued_at', 'format'}
+                # Document is already up to date; its bookkeeping goes out on its own
+                pipe = self.redis_client.pipeline(transaction=False)
+                on_done(True, pipe)
+                pipe.execute()
+                return True
             
-            # Clean up document for Solr
+            # Clean up document for Solr, dropping fields that are not in our schema
             solr_doc = {k: v for k, v in document.items() 
-                       if v is not None and k not in excluded_fields}
+                       if v is not None and k not in SOLR_EXCLUDED_FIELDS}
             
-            # Post to Solr
-            response = requests.post(
-                f"{self.solr_url}/update?commit=true",
-                json=[solr_doc],
-                headers={'Content-Type': 'application/json'}
-            )
+            def indexed(success: bool, pipe):
+                if success:
+                    self._remember_indexed_meta(solr_doc['file_path'], solr_doc, pipe)
+                on_done(success, pipe)
             
-            if response.status_code == 200:
-                logger.info("Document indexed in Solr", file_path=document.get('file_path'))
-                return True
-            else:
-                logger.error("Failed to index in Solr", 
-                           status_code=response.status_code, 
-                           response=response.text)
-                return False
+            self.solr_batcher.add(solr_doc, indexed)
+            return True
                 
         except Exception as e:
             logger.error("Solr indexing error", error=str(e))
             return False
     
-    def trigger_thumbnail_generation(self, message: Dict[str, Any]):
-        """Trigger thumbnail generation for supported files"""
+    def trigger_thumbnail_generation(self, message: Dict[str, Any], pipe=None):
+        """Trigger thumbnail generation for supported files, queuing on pipe when given"""
         try:
             # Check if file type supports thumbnails
             file_extension = message.get('file_extension', '').lower()
-            image_formats = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
-            video_formats = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpg', '.mpeg'}
-            
-            if file_extension in image_formats or file_extension in video_formats:
+            if file_extension in THUMBNAIL_EXTENSIONS:
                 # Send message to thumbnail generation queue
-                self.redis_client.lpush(self.thumbnail_queue, json.dumps(message))
+                (pipe or self.redis_client).lpush(self.thumbnail_queue, orjson.dumps(message))
                 logger.info("Triggered thumbnail generation", 
                           file_path=message.get('file_path'),
                           file_type=file_extension)
         except Exception as e:
             logger.error("Failed to trigger thumbnail generation", error=str(e))
     
-    def delete_from_solr(self, file_path) -> bool:
-        """Delete document from Solr using file_path query"""
+    def delete_from_solr(self, file_path, on_done: Callable[[bool, Any], None]) -> bool:
+        """Queue deletion of a document from Solr using file_path query"""
         try:
             # Since we now use deterministic IDs, we need to delete by file_path query
             # file_path can be either a Path object or string (standardized path)
             path_str = str(file_path)
-            delete_query = f'file_path:"{path_str}"'
             
-            response = requests.post(
-                f"{self.solr_url}/update?commit=true",
-                data=f'<delete><query>{delete_query}</query></delete>',
-                headers={'Content-Type': 'text/xml'}
-            )
+            # Forget the indexed metadata only once the delete is sent, after any add
+            # for the path buffered ahead of it has recorded its own
+            def deleted(success: bool, pipe):
+                if success:
+                    self._cache_indexed_meta(path_str, None)
+                    pipe.delete(f"solr_meta:{path_str}")
+                on_done(success, pipe)
             
-            if response.status_code == 200:
-                logger.info("Document deleted from Solr", file_path=path_str)
-                return True
-            else:
-                logger.error("Failed to delete from Solr", 
-                           status_code=response.status_code, 
-                           response=response.text)
-                return False
+            self.solr_batcher.delete(f'{{!term f=file_path}}{path_str}', deleted)
+            logger.info("Document queued for deletion from Solr", file_path=path_str)
+            return True
                 
         except Exception as e:
             logger.error("Solr deletion error", error=str(e))
             return False
     
+    def _process_message(self, message: Dict[str, Any], slots: threading.BoundedSemaphore):
+        """Process one queue message on a worker thread"""
+        try:
+            logger.info("Processing file", 
+                      file_path=message.get('file_path'),
+                      event_type=message.get('event_type'))
+            
+            success = self.process_file(message)
+            
+            if not success:
+                # Could implement retry logic here
+                logger.error("File processing failed", message=message)
+        finally:
+            slots.release()
+    
     def process_queue(self):
-        """Process files from the Redis queue"""
-        logger.info("Starting queue processing")
+        """Process files from the Redis queue on a pool of worker threads"""
+        logger.info("Starting queue processing", max_workers=self.max_workers)
         
-        while True:
-            try:
-                # Block for 1 second waiting for messages
-                result = self.redis_client.brpop(self.processing_queue, timeout=1)
-                
-                if result:
-                    queue_name, message_data = result
-                    message = json.loads(message_data)
+        # Only pop a message once a worker is free, so messages stay in Redis
+        # (and survive a restart) instead of piling up in the executor
+        slots = threading.BoundedSemaphore(self.max_workers)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='extract') as executor:
+            while not self.shutdown_event.is_set():
+                held = 0  # worker slots claimed but not yet handed to a worker
+                try:
+                    if not slots.acquire(timeout=1):
+                        continue
+                    held = 1
+                    # Claim every other free worker too, so one pop can fill them all
+                    while held < self.max_workers and slots.acquire(blocking=False):
+                        held += 1
                     
-                    logger.info("Processing file", 
-                              file_path=message.get('file_path'),
-                              event_type=message.get('event_type'))
+                    # Block for 1 second waiting for messages, taking up to one per free worker
+                    result = self.redis_client.blmpop(1, 1, self.processing_queue, 
+                                                      direction='RIGHT', count=held)
                     
-                    success = self.process_file(message)
-                    
-                    if not success:
-                        # Could implement retry logic here
-                        logger.error("File processing failed", message=message)
-                        
-            except KeyboardInterrupt:
-                logger.info("Shutting down metadata extractor")
-                break
-            except Exception as e:
-                logger.error("Queue processing error", error=str(e))
-                time.sleep(5)  # Brief pause before retrying
+                    for message_data in (result[1] if result else []):
+                        try:
+                            message = orjson.loads(message_data)
+                        except orjson.JSONDecodeError as e:
+                            logger.error("Discarding malformed queue message", error=str(e))
+                            continue
+                        executor.submit(self._process_message, message, slots)
+                        held -= 1
+                            
+                except KeyboardInterrupt:
+                    break
+                except Exception as e:
+                    logger.error("Queue processing error", error=str(e))
+                    time.sleep(5)  # Brief pause before retrying
+                finally:
+                    for _ in range(held):
+                        slots.release()
+        
+        # Workers have finished; send their last updates before exiting
+        logger.info("Shutting down metadata extractor")
+        self.solr_batcher.stop()
+    
+    def _install_signal_handlers(self):
+        """Stop the queue loop on SIGINT/SIGTERM, so in-flight files finish and buffered updates are committed"""
+        def stop(signum, frame):
+            self.shutdown_event.set()
+        
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+    
+    def _run_worker(self):
+        """Worker process entry point, with its own Redis connection, extractors and Solr batcher"""
+        # Handlers are inherited across fork; SIGINT from the supervisor stops the queue loop
+        self._install_signal_handlers()
+        
+        self.connect_redis()
+        self.initialize_extractor()
+        self.process_queue()
+    
+    def supervise_workers(self):
+        """Run worker_processes queue loops, restarting any that exit, until stopped"""
+        logger.info("Starting worker processes", worker_processes=self.worker_processes,
+                   max_workers=self.max_workers)
+        
+        context = multiprocessing.get_context('fork')
+        workers: Dict[int, multiprocessing.Process] = {}
+        stopping = threading.Event()
+        
+        def stop(signum, frame):
+            stopping.set()
+            # Ctrl-C already reaches the whole process group; pass anything else on as SIGINT
+            if signum != signal.SIGINT:
+                for worker in workers.values():
+                    if worker.is_alive():
+                        os.kill(worker.pid, signal.SIGINT)
+        
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        
+        while not stopping.is_set():
+            for index in range(self.worker_processes):
+                worker = workers.get(index)
+                if worker is not None and worker.is_alive():
+                    continue
+                if worker is not None:
+                    logger.warning("Worker process exited, restarting", worker=index, exitcode=worker.exitcode)
+                worker = workers[index] = context.Process(target=self._run_worker, name=f'extractor-{index}')
+                worker.start()
+            stopping.wait(5)
+        
+        # Let workers flush their last Solr batches before exiting
+        logger.info("Shutting down worker processes")
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        for worker in workers.values():
+            worker.join(timeout=max(0, deadline - time.monotonic()))
+            if worker.is_alive():
+                worker.kill()
     
     def run(self):
         """Main service entry point"""
         logger.info("Starting Metadata Extractor Service")
         
         try:
+            if self.worker_processes > 1:
+                self.supervise_workers()
+                return
+            
+            # docker stop sends SIGTERM; without a handler buffered Solr updates would be lost
+            self._install_signal_handlers()
             self.connect_redis()
             self.initialize_extractor()
             self.process_queue()